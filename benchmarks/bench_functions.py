@@ -0,0 +1,252 @@
+'''
+
+Offline benchmark of the functions of zefix_tools, run against the local mock Zefix API of benchmarks/mock_zefix.py
+(so no network is needed and the results are reproducible).
+
+For every function and every size (number of firms) it reports:
+- the number of requests received by the server, per endpoint, and the number of 503 errors it returned
+- the wall time of the call
+- the p50 and p99 latency of fetching one record (one firm, retries included)
+- the peak memory (RSS increase) of the call
+
+Each measure runs in a new Python process, so caches and memory of one measure do not affect the next one.
+Translations use an offline backend that returns the texts unchanged.
+
+With --processes, it measures instead how iter_companies scales with the number of worker processes (processes=1 is the thread mode):
+the wall time of a first run with an empty response cache and of a second run with all the responses cached, for every number of
+processes and size. Translations are turned off there, so the measure is fetching and deriving the records.
+
+Usage (from the root of the repository):
+
+python benchmarks/bench_functions.py
+python benchmarks/bench_functions.py --sizes 10 1000 10000 --workers 16 --latency 0.005 --error-rate 0.01
+python benchmarks/bench_functions.py --functions search acquisitions --json results.json
+python benchmarks/bench_functions.py --processes 1 2 4 --sizes 1000 10000
+
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_zefix import start_server
+
+# root of the repository, where zefix_tools.py is
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# function benchmarked -> (shape of the takeovers served by the mock server, call run in the child process)
+FUNCTIONS = {
+    'search': ('none', "zefix_tools.search_companies_named('Firm', df=False, max_workers={workers})"),
+    'acquisitions': ('tree', "zefix_tools.get_acquisitions_data(1, max_workers={workers})"),
+    'acquirers': ('star-up', "zefix_tools.check_acquirers('1', df=False, max_workers={workers})"),
+    'asearch': ('none', "asyncio.run(zefix_tools.asearch_companies_named('Firm', df=False, max_workers={workers}))"),
+    'aacquisitions': ('tree', "asyncio.run(zefix_tools.aget_acquisitions_data(1, max_workers={workers}))"),
+    'aacquirers': ('star-up', "asyncio.run(zefix_tools.acheck_acquirers('1', df=False, max_workers={workers}))"),
+}
+
+# code run in a new process: runs one call against the mock server and prints the measures as JSON
+CHILD = '''
+import asyncio, json, resource, sys, time
+sys.path.insert(0, {root!r})
+import zefix_tools
+
+zefix_tools.configure_client(base_url={base_url!r}, rate_limit=0, pool_size={workers}, backoff=0.01, max_backoff=0.1)
+zefix_tools.configure_translation(backend=lambda texts: list(texts))
+
+# time of every record fetched (one firm, retries included)
+latencies = []
+get_firm, aget_firm = zefix_tools._get_firm, zefix_tools._aget_firm
+
+def timed_get_firm(ehraid):
+    start = time.perf_counter()
+    try:
+        return get_firm(ehraid)
+    finally:
+        latencies.append(time.perf_counter() - start)
+
+async def timed_aget_firm(ehraid, client):
+    start = time.perf_counter()
+    try:
+        return await aget_firm(ehraid, client)
+    finally:
+        latencies.append(time.perf_counter() - start)
+
+zefix_tools._get_firm, zefix_tools._aget_firm = timed_get_firm, timed_aget_firm
+
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+result = {call}
+seconds = time.perf_counter() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+latencies.sort()
+print(json.dumps({{
+    'seconds': seconds,
+    'records': len(result),
+    'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else None,
+    'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else None,
+    'rss_mb': (rss_after - rss_before) / scale,
+}}))
+'''
+
+
+# code run in a new process for the scaling measure: iter_companies twice with the same response cache (empty, then warm)
+SCALING_CHILD = '''
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+import zefix_tools
+
+if __name__ == '__main__':
+    zefix_tools.configure_client(base_url={base_url!r}, rate_limit=0, pool_size={workers}, backoff=0.01, max_backoff=0.1,
+                                 cache={cache_path!r})
+    zefix_tools.configure_translation(mode='none')
+
+    # check: forked worker processes must never write through the cache connection they inherit from this process
+    main_pid = os.getpid()
+    def trace(statement):
+        if os.getpid() != main_pid and not statement.lstrip().upper().startswith('SELECT'):
+            with open({writes_path!r}, 'a') as file:
+                file.write(f"{{os.getpid()}} {{statement.split()[0]}}\\n")
+    zefix_tools._client.cache._db.set_trace_callback(trace)
+    seconds = []
+    for run in ('cold', 'warm'):
+        if run == 'warm':
+            # entries last used long ago: the search of the main process then leaves times of last use to write when the workers fork
+            with zefix_tools._client.cache._lock:
+                zefix_tools._client.cache._db.execute('UPDATE responses SET used_at = 0')
+                zefix_tools._client.cache._db.commit()
+        start = time.perf_counter()
+        records = sum(1 for company in zefix_tools.iter_companies('Firm', max_workers={workers}, processes={processes}, ordered=False))
+        seconds.append(time.perf_counter() - start)
+    inherited_writes = 0
+    if os.path.exists({writes_path!r}):
+        with open({writes_path!r}) as file:
+            inherited_writes = len(file.readlines())
+    print(json.dumps({{'records': records, 'cold_s': seconds[0], 'warm_s': seconds[1], 'inherited_writes': inherited_writes}}))
+'''
+
+
+def server_request(base_url, path, method='GET'):
+    # calls one of the endpoints of the mock server that are not part of the API (/__stats, /__reset)
+    url = base_url.rsplit('/api/v1', 1)[0] + path
+    with urllib.request.urlopen(urllib.request.Request(url, data=b'' if method == 'POST' else None, method=method)) as response:
+        return json.loads(response.read())
+
+
+def measure(function, base_url, workers):
+
+    '''
+
+    Runs function (a key of FUNCTIONS) once in a new Python process against the mock server at base_url,
+    and returns its measures (dictionary with seconds, records, p50_ms, p99_ms, rss_mb and the requests received by the server).
+
+    '''
+
+    code = CHILD.format(root=ROOT, base_url=base_url, workers=workers, call=FUNCTIONS[function][1].format(workers=workers))
+    server_request(base_url, '/__reset', 'POST')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=ROOT).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['requests'] = server_request(base_url, '/__stats')
+    return result
+
+
+def measure_scaling(base_url, workers, processes):
+
+    '''
+
+    Runs iter_companies with the given number of worker processes in a new Python process against the mock server at base_url,
+    once with an empty response cache and once with a warm one, and returns {'records', 'cold_s', 'warm_s', 'inherited_writes'}.
+    inherited_writes counts the statements other than SELECT that the worker processes ran on the cache connection of the main process,
+    and must be 0.
+
+    '''
+
+    with tempfile.TemporaryDirectory() as directory:
+        code = SCALING_CHILD.format(root=ROOT, base_url=base_url, workers=workers, processes=processes,
+                                    cache_path=os.path.join(directory, 'cache.sqlite'), writes_path=os.path.join(directory, 'writes.txt'))
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=ROOT).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def scaling(args):
+    # table of the scaling measure, see the docstring of the module
+    print(f"iter_companies with max_workers={args.workers} per process, {os.cpu_count()} CPUs")
+    print(f"{'firms':>7}{'processes':>11}{'records':>9}{'cold s':>9}{'warm s':>9}{'speedup':>9}")
+    results = []
+    for size in args.sizes:
+        base_url, process = start_server(size, 'none', args.latency, args.jitter, args.error_rate, seed=args.seed)
+        try:
+            baseline = None
+            for processes in args.processes:
+                result = measure_scaling(base_url, args.workers, processes)
+                baseline = baseline or result['warm_s']
+                result.update(firms=size, processes=processes, workers=args.workers, cpus=os.cpu_count())
+                results.append(result)
+                print(f"{size:>7}{processes:>11}{result['records']:>9}{result['cold_s']:>9.2f}{result['warm_s']:>9.2f}"
+                      f"{baseline / result['warm_s']:>9.2f}")
+                if result['inherited_writes']:
+                    raise RuntimeError(f"worker processes wrote {result['inherited_writes']} times through the cache connection of the main process")
+        finally:
+            process.terminate()
+            process.join()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmark of zefix_tools against a local mock Zefix API')
+    parser.add_argument('--functions', nargs='+', default=list(FUNCTIONS), choices=list(FUNCTIONS), help='functions to benchmark (default: all)')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 1000, 10000], help='numbers of firms (default: 10 1000 10000)')
+    parser.add_argument('--workers', type=int, default=8, help='max_workers passed to the functions (default: 8)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds waited by the server before each answer (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency of the server, up to this many seconds (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503 (default: 0)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data (default: 0)')
+    parser.add_argument('--processes', nargs='+', type=int, default=None,
+                        help='measure how iter_companies scales with these numbers of worker processes instead, e.g. 1 2 4')
+    parser.add_argument('--json', default=None, help='also save the results in this JSON file')
+    args = parser.parse_args(argv)
+
+    if args.processes:
+        results = scaling(args)
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump(results, file, indent=2)
+        return 0
+
+    print(f"{'function':<14}{'firms':>7}{'records':>9}{'requests':>10}{'errors':>8}{'wall s':>9}{'p50 ms':>9}{'p99 ms':>9}{'RSS MB':>9}")
+    results = []
+    for size in args.sizes:
+        # one server per size and shape of the takeovers
+        for shape in dict.fromkeys(FUNCTIONS[function][0] for function in args.functions):
+            base_url, process = start_server(size, shape, args.latency, args.jitter, args.error_rate, seed=args.seed)
+            try:
+                for function in args.functions:
+                    if FUNCTIONS[function][0] != shape:
+                        continue
+                    result = measure(function, base_url, args.workers)
+                    result.update(function=function, firms=size, shape=shape, workers=args.workers)
+                    results.append(result)
+                    requests = result['requests']
+                    p50 = f"{result['p50_ms']:.2f}" if result['p50_ms'] is not None else '-'
+                    p99 = f"{result['p99_ms']:.2f}" if result['p99_ms'] is not None else '-'
+                    print(f"{function:<14}{size:>7}{result['records']:>9}"
+                          f"{requests['search'] + requests['firm'] + requests['legalForm']:>10}{requests['errors']:>8}"
+                          f"{result['seconds']:>9.2f}{p50:>9}{p99:>9}{result['rss_mb']:>9.1f}")
+            finally:
+                process.terminate()
+                process.join()
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+'''
+
+Measures the cold import time and the memory (peak RSS) of importing zefix_tools, each time in a new Python process,
+and checks that pandas, matplotlib and googletrans are not imported until they are needed.
+
+Usage (from the root of the repository):
+
+python benchmarks/bench_import.py
+python benchmarks/bench_import.py --runs 20 --max-seconds 0.5 --max-rss-mb 60
+
+With --max-seconds / --max-rss-mb the script exits with code 1 if the median import time or the median RSS increase is above the limit,
+or if one of the heavy modules is imported, so that it can be used to catch regressions.
+
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# root of the repository, where zefix_tools.py is
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must not be loaded by a plain import of zefix_tools
+HEAVY_MODULES = ['pandas', 'matplotlib', 'googletrans']
+
+# code run in a new process: imports the module and prints time, RSS increase and heavy modules loaded as JSON
+CHILD = '''
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+print(json.dumps({{
+    'seconds': seconds,
+    'rss_mb': (rss_after - rss_before) / scale,
+    'heavy': [name for name in {heavy!r} if name in sys.modules],
+}}))
+'''
+
+
+def measure(module, runs):
+
+    '''
+
+    Imports module in runs new Python processes and returns the list of measures (dictionaries with seconds, rss_mb and heavy).
+
+    '''
+
+    code = CHILD.format(root=ROOT, module=module, heavy=HEAVY_MODULES)
+    measures = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        measures.append(json.loads(output.strip().splitlines()[-1]))
+    return measures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cold import time and memory of zefix_tools')
+    parser.add_argument('--runs', type=int, default=10, help='number of new processes (default: 10)')
+    parser.add_argument('--max-seconds', type=float, default=None, help='fail if the median import time is above this')
+    parser.add_argument('--max-rss-mb', type=float, default=None, help='fail if the median RSS increase is above this')
+    args = parser.parse_args(argv)
+
+    measures = measure('zefix_tools', args.runs)
+    seconds = statistics.median(m['seconds'] for m in measures)
+    rss_mb = statistics.median(m['rss_mb'] for m in measures)
+    heavy = sorted({name for m in measures for name in m['heavy']})
+
+    print(f"import zefix_tools: median {seconds * 1000:.1f} ms, max {max(m['seconds'] for m in measures) * 1000:.1f} ms, "
+          f"median RSS +{rss_mb:.1f} MB ({args.runs} runs)")
+    print(f"heavy modules imported: {', '.join(heavy) if heavy else 'none'}")
+
+    failed = False
+    if heavy:
+        print("FAIL: heavy modules must be imported only when they are used")
+        failed = True
+    if args.max_seconds is not None and seconds > args.max_seconds:
+        print(f"FAIL: median import time above {args.max_seconds} s")
+        failed = True
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        print(f"FAIL: median RSS increase above {args.max_rss_mb} MB")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+'''
+
+Local stand-in for the Zefix REST API, serving synthetic data, used by the benchmarks to measure the functions of zefix_tools offline.
+
+It serves the same endpoints the package uses:
+
+POST /api/v1/firm/search.json      firms whose name contains the searched name (not caps sensitive), filtered by the cantons and
+                                   legalForms lists of the body if given, and paged with maxEntries and offset
+GET  /api/v1/firm/{ehraid}         details of a firm
+GET  /api/v1/legalForm             legal forms table
+
+and two endpoints for the benchmarks:
+
+GET  /__stats                      number of requests received per endpoint, and of errors returned
+POST /__reset                      sets the counters back to 0
+
+The firms are numbered 1 to n_firms and are all named 'Firm <ehraid> ...', so searching 'Firm' finds all of them.
+The takeovers between firms follow one of these shapes:
+
+none        no takeovers
+chain       firm i has taken over firm i+1
+tree        firm i has taken over firms 2i and 2i+1 (binary tree rooted in firm 1)
+dag         tree, plus every 10th firm also taken over by a second firm (shared subsidiaries)
+star        firm 1 has taken over all the other firms
+star-up     all the other firms have taken over firm 1 (firm 1 has n_firms - 1 acquirers)
+
+Usage:
+
+python benchmarks/mock_zefix.py --firms 1000 --shape tree --latency 0.01 --error-rate 0.01 --port 8099
+
+then configure_client(base_url='http://127.0.0.1:8099/api/v1') in zefix_tools. From Python, start_server(...) runs it in a separate process.
+
+'''
+
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SHAPES = ['none', 'chain', 'tree', 'dag', 'star', 'star-up']
+
+LEGAL_FORMS = [
+    {'id': 1, 'name': {'de': 'Einzelunternehmen', 'fr': 'Entreprise individuelle', 'it': 'Ditta individuale', 'en': 'Sole proprietorship'}},
+    {'id': 2, 'name': {'de': 'Kollektivgesellschaft', 'fr': 'Société en nom collectif', 'it': 'Società in nome collettivo', 'en': 'General partnership'}},
+    {'id': 3, 'name': {'de': 'Aktiengesellschaft', 'fr': 'Société anonyme', 'it': 'Società anonima', 'en': 'Corporation'}},
+    {'id': 4, 'name': {'de': 'Gesellschaft mit beschränkter Haftung', 'fr': 'Société à responsabilité limitée', 'it': 'Società a garanzia limitata', 'en': 'Limited liability company'}},
+    {'id': 5, 'name': {'de': 'Genossenschaft', 'fr': 'Société coopérative', 'it': 'Società cooperativa', 'en': 'Cooperative'}},
+    {'id': 6, 'name': {'de': 'Verein', 'fr': 'Association', 'it': 'Associazione', 'en': 'Association'}},
+    {'id': 7, 'name': {'de': 'Stiftung', 'fr': 'Fondation', 'it': 'Fondazione', 'en': 'Foundation'}},
+]
+
+# (town, zip code, canton)
+SEATS = [('Zürich', '8001', 'ZH'), ('Genève', '1204', 'GE'), ('Basel', '4051', 'BS'), ('Lausanne', '1003', 'VD'),
+         ('Bern', '3011', 'BE'), ('Lugano', '6900', 'TI'), ('Luzern', '6003', 'LU'), ('St. Gallen', '9000', 'SG')]
+
+PURPOSES = [
+    'Erbringung von Dienstleistungen im Bereich der Informatik.',
+    'Exploitation d\'un restaurant et de services de traiteur.',
+    'Gestione di partecipazioni in altre società.',
+    'Handel mit Waren aller Art sowie Import und Export.',
+    'Conseil en gestion d\'entreprise et en finance.',
+    'Erwerb, Verwaltung und Veräusserung von Immobilien.',
+]
+
+STATUSES = ['EXISTIEREND'] * 8 + ['GELOESCHT', 'IN_AUFLOESUNG']
+
+
+def takeovers(n_firms, shape):
+
+    '''
+
+    Returns the list of takeovers (acquirer, acquired) between the firms 1..n_firms for the given shape.
+
+    '''
+
+    if shape == 'none':
+        return []
+    if shape == 'chain':
+        return [(i, i + 1) for i in range(1, n_firms)]
+    if shape in ('tree', 'dag'):
+        edges = [(i // 2, i) for i in range(2, n_firms + 1)]
+        if shape == 'dag':
+            edges += [(i // 2 + 1, i) for i in range(10, n_firms + 1, 10) if i // 2 + 1 != i]
+        return edges
+    if shape == 'star':
+        return [(1, i) for i in range(2, n_firms + 1)]
+    if shape == 'star-up':
+        return [(i, 1) for i in range(2, n_firms + 1)]
+    raise ValueError(f"shape must be one of {SHAPES}")
+
+
+def make_firms(n_firms, shape='tree', seed=0):
+
+    '''
+
+    Returns a dictionary ehraid -> details of the firm (same fields as the /firm/{ehraid} endpoint of Zefix) with n_firms synthetic firms.
+    The same n_firms, shape and seed always give the same data.
+
+    '''
+
+    rng = random.Random(seed)
+    firms = {}
+    for ehraid in range(1, n_firms + 1):
+        town, zip_code, canton = rng.choice(SEATS)
+        status = rng.choice(STATUSES)
+        firms[ehraid] = {
+            'name': f"Firm {ehraid} {rng.choice(['AG', 'GmbH', 'SA', 'Sàrl', 'Holding AG'])}",
+            'ehraid': ehraid,
+            'uid': f"CHE{100000000 + ehraid}",
+            'chid': f"CH{ehraid:011d}",
+            'legalSeat': town,
+            'canton': canton,
+            'legalFormId': rng.choice(LEGAL_FORMS)['id'],
+            'status': status,
+            'deleteDate': '2020-06-30' if status == 'GELOESCHT' else None,
+            'cantonalExcerptWeb': f"https://{canton.lower()}.chregister.ch/cr-portal/auszug/auszug.xhtml?uid=CHE{100000000 + ehraid}",
+            'purpose': rng.choice(PURPOSES),
+            'capitalNominal': str(rng.choice([20000, 100000, 1000000])),
+            'address': {'street': 'Bahnhofstrasse', 'houseNumber': str(rng.randint(1, 200)), 'town': town, 'swissZipCode': zip_code},
+            'shabPub': [{'shabId': ehraid * 10 + k, 'shabDate': f"20{10 + k}-01-15", 'message': 'Mutation'} for k in range(rng.randint(0, 5))],
+            'branchOffices': [],
+            'oldNames': [{'name': f"Old Firm {ehraid}"}] if rng.random() < 0.2 else [],
+            'hasTakenOver': [],
+            'wasTakenOverBy': [],
+        }
+    for acquirer, acquired in takeovers(n_firms, shape):
+        firms[acquirer]['hasTakenOver'].append({'ehraid': acquired, 'name': firms[acquired]['name']})
+        firms[acquired]['wasTakenOverBy'].append({'ehraid': acquirer, 'name': firms[acquirer]['name']})
+    return firms
+
+
+def search_result(firm):
+    # fields of a firm in the list returned by search.json
+    fields = ['name', 'ehraid', 'uid', 'chid', 'legalSeat', 'legalFormId', 'status', 'deleteDate', 'cantonalExcerptWeb']
+    return {field: firm[field] for field in fields}
+
+
+def make_handler(firms, latency=0.0, jitter=0.0, error_rate=0.0, search_cap=None, seed=0):
+
+    '''
+
+    Returns the request handler class of the mock server.
+
+    Parameters:
+    firms (dict): ehraid -> details, see make_firms
+    latency (float): seconds waited before answering each request
+    jitter (float): random extra seconds (uniform between 0 and jitter) added to latency
+    error_rate (float): fraction of the requests answered with a 503 error
+    search_cap (int): None by default. If given, a search can only reach its first search_cap firms, whatever the offset,
+                      like the real API does: the other ones are only found by narrower searches
+
+    '''
+
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    stats = {'search': 0, 'firm': 0, 'legalForm': 0, 'errors': 0}
+    names = [(firm['name'].lower(), ehraid) for ehraid, firm in firms.items()]
+    firm_path = re.compile(r'^/api/v1/firm/(\d+)$')
+
+    class Handler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+        # headers and body are written separately: without this, delayed ACKs add ~40 ms to every keep-alive answer
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status_code, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _delay_or_fail(self, endpoint):
+            # count the request, wait the latency, and decide if it fails
+            with lock:
+                stats[endpoint] += 1
+                delay = latency + (rng.random() * jitter if jitter else 0.0)
+                fail = error_rate and rng.random() < error_rate
+                if fail:
+                    stats['errors'] += 1
+            if delay:
+                time.sleep(delay)
+            if fail:
+                self._send(503, {'error': 'Service Unavailable'})
+            return fail
+
+        def do_GET(self):
+            if self.path == '/__stats':
+                with lock:
+                    return self._send(200, dict(stats))
+            if self.path == '/api/v1/legalForm':
+                if not self._delay_or_fail('legalForm'):
+                    self._send(200, LEGAL_FORMS)
+                return
+            match = firm_path.match(self.path)
+            if match:
+                if not self._delay_or_fail('firm'):
+                    ehraid = int(match.group(1))
+                    if ehraid in firms:
+                        self._send(200, firms[ehraid])
+                    else:
+                        self._send(404, {'error': 'Not Found'})
+                return
+            self._send(404, {'error': 'Not Found'})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+            if self.path == '/__reset':
+                with lock:
+                    for key in stats:
+                        stats[key] = 0
+                return self._send(200, {})
+            if self.path == '/api/v1/firm/search.json':
+                if self._delay_or_fail('search'):
+                    return
+                query = json.loads(body or b'{}')
+                name = (query.get('name') or '').lower()
+                cantons = set(query.get('cantons') or [])
+                legal_forms = set(query.get('legalForms') or [])
+                found = [firms[ehraid] for firm_name, ehraid in names if name in firm_name]
+                if cantons:
+                    found = [firm for firm in found if firm['canton'] in cantons]
+                if legal_forms:
+                    found = [firm for firm in found if firm['legalFormId'] in legal_forms]
+                reachable = found if search_cap is None else found[:search_cap]
+                offset = int(query.get('offset') or 0)
+                max_entries = query.get('maxEntries')
+                page = reachable[offset:] if max_entries is None else reachable[offset:offset + int(max_entries)]
+                return self._send(200, {'list': [search_result(firm) for firm in page], 'hasMoreResults': len(found) > offset + len(page)})
+            self._send(404, {'error': 'Not Found'})
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    # the default listen backlog of 5 overflows when a benchmark opens 8-16 connections at once, and the kernel then waits
+    # about a second before retrying them: the latencies measured would be those of the mock server, not of the client
+    request_queue_size = 128
+
+
+def serve(n_firms=1000, shape='tree', latency=0.0, jitter=0.0, error_rate=0.0, search_cap=None, seed=0, host='127.0.0.1', port=8099, ready=None):
+
+    '''
+
+    Runs the mock server until the process is stopped. If ready is a multiprocessing queue, the port is put in it once the server listens.
+
+    '''
+
+    firms = make_firms(n_firms, shape, seed)
+    handler = make_handler(firms, latency, jitter, error_rate, search_cap, seed)
+    server = _Server((host, port), handler)
+    server.daemon_threads = True
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server(n_firms=1000, shape='tree', latency=0.0, jitter=0.0, error_rate=0.0, search_cap=None, seed=0):
+
+    '''
+
+    Starts the mock server in a separate process, on a free port.
+
+    Returns:
+    base_url (str): base url to pass to zefix_tools.configure_client(base_url=...)
+    process (multiprocessing.Process): the server process, stop it with process.terminate()
+
+    '''
+
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, kwargs=dict(
+        n_firms=n_firms, shape=shape, latency=latency, jitter=jitter, error_rate=error_rate,
+        search_cap=search_cap, seed=seed, port=0, ready=ready), daemon=True)
+    process.start()
+    port = ready.get(timeout=60)
+    return f"http://127.0.0.1:{port}/api/v1", process
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for the Zefix REST API, with synthetic data')
+    parser.add_argument('--firms', type=int, default=1000, help='number of firms (default: 1000)')
+    parser.add_argument('--shape', default='tree', choices=SHAPES, help='shape of the takeovers (default: tree)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds waited before each answer (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency, up to this many seconds (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503 (default: 0)')
+    parser.add_argument('--search-cap', type=int, default=None, help='maximum number of firms a search can reach, whatever its offset: the others need narrower searches (default: no limit)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data (default: 0)')
+    parser.add_argument('--port', type=int, default=8099, help='port (default: 8099)')
+    args = parser.parse_args(argv)
+
+    print(f"Mock Zefix API with {args.firms} firms ({args.shape}) on http://127.0.0.1:{args.port}/api/v1")
+    serve(args.firms, args.shape, args.latency, args.jitter, args.error_rate, args.search_cap, args.seed, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,485 +1,3528 @@
 import sys, os
+import asyncio
+import bisect
+import contextlib
+import gzip
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+import weakref
 import requests
 import json
-import pandas as pd
-import matplotlib.pyplot as plt
-from googletrans import Translator
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+# pandas, matplotlib and googletrans are slow to import and heavy in memory: they are imported inside the functions
+# that use them (DataFrames, plots, translations), so that importing this module stays fast for code that only needs dictionaries
+
+## API SETTINGS AND ERRORS
+
+# base url of the Zefix REST API
+ZEFIX_API_URL = 'https://www.zefix.ch/ZefixREST/api/v1'
+
+# error messages returned by the functions of this module for each unsuccessful status code
+_ERROR_MESSAGES = {
+    400: "400 Bad Request Error",
+    401: "401 Unauthorized Error",
+    403: "403 Forbidden Error",
+    404: "404 Not Found Error",
+    408: "408 Request Timeout Error",
+    429: "429 Too Many Requests Error",
+    500: "500 Internal Server Error",
+    502: "502 Bad Gateway Error",
+    503: "503 Service Unavailable Error",
+    504: "504 Gateway Timeout Error",
+}
+
+# status codes worth trying again: timeouts, throttling and server side errors
+_RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class ZefixError(Exception):
+
+    '''
+
+    Raised when a request to the Zefix API is not successful, after all retries are exhausted.
+
+    Attributes:
+    status_code (int): HTTP status code of the last response, None if no response was received (e.g. connection error)
+    url (str): url of the request
+    message (str): human readable error message, e.g. "404 Not Found Error"
+
+    '''
+
+    def __init__(self, status_code, url, message=None):
+        if message is None:
+            message = _ERROR_MESSAGES.get(status_code, "Unexpected Error, the request was not successful")
+        super().__init__(message)
+        self.status_code = status_code
+        self.url = url
+        self.message = message
+
+
+## INSTRUMENTATION
+
+class ZefixMetrics:
+
+    '''
+
+    Records where the functions of this module spend their time: requests sent to the Zefix API (count, latency histogram, bytes,
+    errors and retries per endpoint), cache hits, and the time spent in each stage (API calls, translation, DataFrame building)
+    and in each public function. Every call of the module reports to the metrics object set with configure_metrics.
+
+    Parameters:
+    callbacks (list of callables): None by default. Functions called with every event, a dictionary with an 'event' key:
+                                   'request' (endpoint, seconds, status_code, bytes), 'retry' (endpoint, status_code, attempt),
+                                   'cache' (outcome) or 'span' (name, seconds, attributes, error)
+    tracer: None by default. An OpenTelemetry tracer (opentelemetry.trace.get_tracer(...)), or any object with a
+            start_as_current_span(name, attributes=...) context manager: every stage is then also traced as a span named 'zefix.<stage>'
+    buckets (tuple): upper bounds, in seconds, of the buckets of the latency histograms
+
+    Example: configure_metrics() before a crawl, then print(get_metrics().summary()) after it.
+
+    '''
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, callbacks=None, tracer=None, buckets=LATENCY_BUCKETS):
+        self.callbacks = list(callbacks or [])
+        self.tracer = tracer
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+
+        '''
+
+        Sets all the counters back to 0.
+
+        '''
+
+        with self._lock:
+            self.endpoints = {}
+            self.cache = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stale': 0}
+            self.stages = {}
+
+    def _endpoint_stats(self, endpoint):
+        # counters of an endpoint, created at its first request. called with the lock held
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = {'requests': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                                'histogram': [0] * (len(self.buckets) + 1)}
+        return stats
+
+    def _emit(self, event):
+        # a failing callback must not stop the crawl
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print("Metrics callback failed:", repr(e))
+
+    def record_request(self, endpoint, seconds, status_code, nbytes):
+
+        '''
+
+        Records one request sent to the API (one try: a request retried twice is recorded three times).
+
+        Parameters:
+        endpoint (str): endpoint, e.g. 'firm/{ehraid}'
+        seconds (float): time until the response (or the error) was received
+        status_code (int): HTTP status code, None if no response was received
+        nbytes (int): size of the body of the response
+
+        '''
+
+        with self._lock:
+            stats = self._endpoint_stats(endpoint)
+            stats['requests'] += 1
+            stats['bytes'] += nbytes
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['histogram'][bisect.bisect_left(self.buckets, seconds)] += 1
+            if status_code not in (200, 304):
+                stats['errors'] += 1
+        if self.callbacks:
+            self._emit({'event': 'request', 'endpoint': endpoint, 'seconds': seconds, 'status_code': status_code, 'bytes': nbytes})
+
+    def record_retry(self, endpoint, status_code, attempt):
+
+        '''
+
+        Records that a failed request to endpoint is tried again (status_code None for a connection error).
+
+        '''
+
+        with self._lock:
+            self._endpoint_stats(endpoint)['retries'] += 1
+        if self.callbacks:
+            self._emit({'event': 'retry', 'endpoint': endpoint, 'status_code': status_code, 'attempt': attempt})
+
+    def record_cache(self, outcome):
+
+        '''
+
+        Records the outcome of a lookup in the response cache: 'hits', 'misses', 'revalidated' or 'stale'.
+
+        '''
+
+        with self._lock:
+            self.cache[outcome] += 1
+        if self.callbacks:
+            self._emit({'event': 'cache', 'outcome': outcome})
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+
+        '''
+
+        Context manager timing a stage (e.g. 'firms', 'translate', 'dataframe', 'search_companies_named').
+        The time is added to the stage in stages, and the stage is traced as a span if the metrics have a tracer.
+
+        '''
+
+        start = time.perf_counter()
+        error = None
+        try:
+            if self.tracer is not None:
+                with self.tracer.start_as_current_span(f"zefix.{name}", attributes=attributes):
+                    yield
+            else:
+                yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+                stage['calls'] += 1
+                stage['seconds'] += seconds
+            if self.callbacks:
+                self._emit({'event': 'span', 'name': name, 'seconds': seconds, 'attributes': attributes, 'error': error})
+
+    def _quantile(self, stats, q):
+        # upper bound of the histogram bucket holding the quantile q of the latencies (the maximum for the last bucket)
+        rank = q * stats['requests']
+        seen = 0
+        for bound, count in zip(self.buckets, stats['histogram']):
+            seen += count
+            if seen >= rank:
+                return min(bound, stats['max_seconds'])
+        return stats['max_seconds']
+
+    def snapshot(self):
+
+        '''
+
+        Returns a copy of all the counters as a dictionary {'endpoints', 'cache', 'stages'}. Each endpoint also has
+        its mean, p50, p99 and max latency in seconds (p50 and p99 are the upper bounds of their histogram buckets).
+
+        '''
+
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in self.endpoints.items():
+                stats = dict(stats, histogram=list(stats['histogram']))
+                if stats['requests']:
+                    stats['mean_seconds'] = stats['seconds'] / stats['requests']
+                    stats['p50_seconds'] = self._quantile(stats, 0.5)
+                    stats['p99_seconds'] = self._quantile(stats, 0.99)
+                endpoints[endpoint] = stats
+            return {
+                'endpoints': endpoints,
+                'cache': dict(self.cache),
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+            }
+
+    def summary(self):
+
+        '''
+
+        Returns a text report of the counters: a table of the requests per endpoint, the cache outcomes and the time spent in each stage.
+
+        '''
+
+        snapshot = self.snapshot()
+        lines = [f"{'endpoint':<20}{'requests':>9}{'errors':>8}{'retries':>9}{'KB':>10}{'mean ms':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+        for endpoint, stats in sorted(snapshot['endpoints'].items()):
+            if stats['requests']:
+                latencies = ''.join(f"{stats[key] * 1000:>9.1f}" for key in ('mean_seconds', 'p50_seconds', 'p99_seconds', 'max_seconds'))
+            else:
+                latencies = f"{'-':>9}" * 4
+            lines.append(f"{endpoint:<20}{stats['requests']:>9}{stats['errors']:>8}{stats['retries']:>9}{stats['bytes'] / 1024:>10.1f}{latencies}")
+        lines.append("cache: " + ', '.join(f"{count} {outcome}" for outcome, count in snapshot['cache'].items()))
+        lines.append(f"{'stage':<30}{'calls':>7}{'seconds':>10}")
+        for name, stage in sorted(snapshot['stages'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"{name:<30}{stage['calls']:>7}{stage['seconds']:>10.3f}")
+        return '\n'.join(lines)
+
+
+def _endpoint(path):
+    # name of the endpoint of a path, with the ehraid replaced so that all the firms are counted together: 'firm/415520' -> 'firm/{ehraid}'
+    return '/'.join('{ehraid}' if part.isdigit() else part for part in path.strip('/').split('/'))
+
+
+# metrics shared by all the functions of this module
+_metrics = ZefixMetrics()
+
+
+def configure_metrics(**kwargs):
+
+    '''
+
+    Replaces the metrics object shared by all the functions of this module with a new one (all counters at 0) built with the given settings.
+
+    Parameters:
+    **kwargs: any parameter of ZefixMetrics (callbacks, tracer, buckets)
+
+    Returns:
+    metrics (ZefixMetrics): the new metrics object
+
+    Example: configure_metrics(callbacks=[print]) to see every request as it is sent.
+    Example: configure_metrics(tracer=opentelemetry.trace.get_tracer('zefix')) to trace every stage with OpenTelemetry.
+
+    '''
+
+    global _metrics
+    _metrics = ZefixMetrics(**kwargs)
+    return _metrics
+
+
+def get_metrics():
+
+    '''
+
+    Returns the metrics object shared by all the functions of this module. Call get_metrics().summary() after any call for a report.
+
+    '''
+
+    return _metrics
+
+
+## RESPONSE CACHE
+
+class ZefixCache:
+
+    '''
+
+    Persistent on-disk cache of the responses of the Zefix API, stored in a SQLite file as compressed JSON.
+    Entries are keyed by endpoint (e.g. 'GET firm/415520'), are considered fresh for ttl seconds, and the least recently used
+    entries are evicted when there are more than max_entries of them. Expired entries are revalidated with the server
+    (If-None-Match / If-Modified-Since) when the API gave an ETag or Last-Modified header, and are still served if the API cannot be reached.
+    Reads do not write to the file one by one: the time an entry was last used is kept in memory and written back in batches,
+    and only when the stored one is more than a minute old, so that a warm run is not slowed down by commits.
+
+    Parameters:
+    path (str): path of the SQLite file, created if it does not exist
+    ttl (float): number of seconds an entry is used without asking the API again. None to never expire entries.
+    max_entries (int): maximum number of entries kept in the file. None for no limit.
+    track_usage (bool): True by default. If False, reads never write to the file (the least recently used order is not updated),
+                        e.g. for worker processes that share the file and should not compete for its write lock.
+
+    Attributes:
+    stats (dict): counters 'hits', 'misses', 'revalidated', 'stale' (served because the API could not be reached) and 'evictions'
+
+    '''
+
+    # seconds after which the time an entry was last used is worth writing again, and number of such times written at once
+    _USED_AT_INTERVAL = 60
+    _USED_AT_BATCH = 1000
+
+    def __init__(self, path='zefix_cache.sqlite', ttl=24 * 60 * 60, max_entries=100000, track_usage=True):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.track_usage = track_usage
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stale': 0, 'evictions': 0}
+
+        # key -> time it was last used, not written to the file yet
+        self._used = {}
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)')
+        self._db.commit()
+        # the connection belongs to this process: a forked child must never write through it (see _detach_inherited_caches)
+        self._pid = os.getpid()
+        self._finalizer = weakref.finalize(self, ZefixCache._write_used, self._db, self._lock, self._used, self._pid)
+        _caches.add(self)
+
+    def _count_stat(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, key):
+
+        '''
+
+        Returns the cached entry for key as a dictionary {'data', 'etag', 'last_modified', 'fresh'}, or None if there is no entry.
+
+        '''
+
+        with self._lock:
+            row = self._db.execute('SELECT body, etag, last_modified, stored_at, used_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            body, etag, last_modified, stored_at, used_at = row
+            now = time.time()
+            if self.track_usage and now - used_at > self._USED_AT_INTERVAL:
+                self._used[key] = now
+                if len(self._used) >= self._USED_AT_BATCH:
+                    self._write_used(self._db, None, self._used, self._pid)
+        fresh = self.ttl is None or now - stored_at <= self.ttl
+        return {'data': json.loads(zlib.decompress(body)), 'etag': etag, 'last_modified': last_modified, 'fresh': fresh}
+
+    def put(self, key, data, etag=None, last_modified=None):
+
+        '''
+
+        Stores data (any JSON serializable object) under key, then evicts the least recently used entries if the cache is full.
+
+        '''
+
+        body = zlib.compress(json.dumps(data).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            self._used.pop(key, None)
+            cursor = self._db.execute(
+                'INSERT OR IGNORE INTO responses (key, body, etag, last_modified, stored_at, used_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, body, etag, last_modified, now, now))
+            if not cursor.rowcount:
+                self._db.execute(
+                    'UPDATE responses SET body = ?, etag = ?, last_modified = ?, stored_at = ?, used_at = ? WHERE key = ?',
+                    (body, etag, last_modified, now, now, key))
+            elif self.max_entries is not None:
+                # counted inside this write transaction, since other processes sharing the file may add or evict entries too
+                extra = self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0] - self.max_entries
+                if extra > 0:
+                    self._write_used(self._db, None, self._used, self._pid, commit=False)
+                    self._db.execute(
+                        'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used_at LIMIT ?)', (extra,))
+                    self.stats['evictions'] += extra
+            self._db.commit()
+
+    def touch(self, key):
+
+        '''
+
+        Marks the entry for key as fresh again, used when the API answers 304 Not Modified.
+
+        '''
+
+        now = time.time()
+        with self._lock:
+            self._used.pop(key, None)
+            self._db.execute('UPDATE responses SET stored_at = ?, used_at = ? WHERE key = ?', (now, now, key))
+            self._db.commit()
+
+    def flush(self):
+
+        '''
+
+        Writes to the file the times the entries were last used that are still kept in memory. Also done when the cache is garbage collected.
+
+        '''
+
+        self._write_used(self._db, self._lock, self._used, self._pid)
+
+    @staticmethod
+    def _write_used(db, lock, used, owner, commit=True):
+        # writes the pending times of last use in one transaction (lock is None when the caller already holds it).
+        # Nothing is written from a process other than owner, the one that opened db: SQLite connections cannot be used across fork()
+        if os.getpid() != owner:
+            return
+        with lock if lock is not None else contextlib.nullcontext():
+            if not used:
+                return
+            db.executemany('UPDATE responses SET used_at = ? WHERE key = ?', [(at, key) for key, at in used.items()])
+            used.clear()
+            if commit:
+                db.commit()
+
+    def clear(self):
+
+        '''
+
+        Removes every entry from the cache and resets the counters.
+
+        '''
+
+        with self._lock:
+            self._used.clear()
+            self._db.execute('DELETE FROM responses')
+            self._db.commit()
+            self.stats = {name: 0 for name in self.stats}
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+# every ZefixCache of this process, so that a forked child can detach the ones it inherited
+_caches = weakref.WeakSet()
+
+
+def _detach_inherited_caches():
+    # runs in the child after a fork (e.g. the worker processes of iter_companies(..., processes=...)): the inherited caches keep
+    # the parent's SQLite connections, which the child must not use. Their pending times of last use belong to the parent, and
+    # their finalizers would write them when the child drops the caches, so both are discarded without touching the connections
+    for cache in list(_caches):
+        cache._finalizer.detach()
+        cache._used = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_detach_inherited_caches)
+
+
+## HTTP CLIENT
+
+class _ZefixClient:
+
+    '''
+
+    Internal client used by every function of this module to talk to the Zefix API.
+    It keeps one pooled keep-alive requests.Session, retries failed calls with exponential backoff and jitter
+    on 408/429/5xx and connection errors, and spaces out the requests so that at most rate_limit requests per second are sent.
+
+    Parameters:
+    base_url (str): base url of the Zefix REST API
+    retries (int): number of times a failed request is tried again
+    backoff (float): base waiting time in seconds before the first retry, doubled at every following retry
+    max_backoff (float): maximum waiting time in seconds between two tries
+    rate_limit (float): maximum number of requests per second, None or 0 to disable the limit
+    timeout (float): timeout in seconds of every request
+    pool_size (int): number of keep-alive connections kept open, should be at least the max_workers used
+    cache (ZefixCache or str): None by default. A ZefixCache, or the path of its SQLite file, used to store and reuse the responses of the API
+
+    '''
+
+    def __init__(self, base_url=ZEFIX_API_URL, retries=3, backoff=0.5, max_backoff=10, rate_limit=10, timeout=30, pool_size=20, cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.cache = ZefixCache(cache) if isinstance(cache, str) else cache
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate_limit = rate_limit
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # time at which the next request is allowed to start (rate limiter)
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def _slot_delay(self):
+        # reserve the next free slot and return how long to wait for it, so that concurrent threads (and tasks) share the same limit
+        if not self.rate_limit:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate_limit
+        return slot - now
+
+    def _retry_delay(self, attempt, retry_after=None):
+        # exponential backoff with full jitter, or the waiting time asked by the server with Retry-After
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.random()
+        if retry_after:
+            try:
+                delay = min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def _send(self, method, url, **kwargs):
+        # sends the request, trying again on timeouts, throttling, server errors and connection errors.
+        # returns the response (200 or 304), raises ZefixError otherwise
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = _endpoint(url[len(self.base_url):])
+
+        for attempt in range(self.retries + 1):
+            time.sleep(self._slot_delay())
+            start = time.perf_counter()
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                _metrics.record_request(endpoint, time.perf_counter() - start, None, 0)
+                if attempt < self.retries:
+                    _metrics.record_retry(endpoint, None, attempt)
+                    time.sleep(self._retry_delay(attempt))
+                    continue
+                raise ZefixError(None, url, f"Connection Error, the request was not successful: {e}") from e
+            _metrics.record_request(endpoint, time.perf_counter() - start, r.status_code, len(r.content))
+
+            if r.status_code in (200, 304):
+                return r
+            if r.status_code in _RETRY_STATUS_CODES and attempt < self.retries:
+                _metrics.record_retry(endpoint, r.status_code, attempt)
+                time.sleep(self._retry_delay(attempt, r.headers.get('Retry-After')))
+                continue
+            raise ZefixError(r.status_code, url)
+
+    def _count_cache(self, outcome):
+        # outcome of a cache lookup, counted both in the cache stats and in the metrics
+        self.cache._count_stat(outcome)
+        _metrics.record_cache(outcome)
+
+    def _cache_lookup(self, method, path, payload=None):
+        # cache key (endpoint, plus the query for POST requests) and cached entry, None if there is no cache or no entry
+        if self.cache is None:
+            return None, None
+        key = f"{method} {path.lstrip('/')}"
+        if payload is not None:
+            key += ' ' + json.dumps(payload, sort_keys=True)
+        return key, self.cache.get(key)
+
+    def _conditional_headers(self, cached):
+        # ask the API only if the entry changed since it was stored
+        headers = {}
+        if cached is not None:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        return headers
+
+    def _cache_response(self, key, cached, status_code, headers, read_json):
+        # stores a new response in the cache (read_json is called only when the body is needed) and returns its data
+        if self.cache is None:
+            return read_json()
+        if status_code == 304 and cached is not None:
+            self._count_cache('revalidated')
+            self.cache.touch(key)
+            return cached['data']
+        self._count_cache('misses')
+        data = read_json()
+        self.cache.put(key, data, headers.get('ETag'), headers.get('Last-Modified'))
+        return data
+
+    def _cache_fallback(self, cached, error):
+        # the API cannot be reached: serve the expired entry if there is one
+        if cached is not None and error.status_code is None:
+            self._count_cache('stale')
+            return cached['data']
+        raise error
+
+    def request(self, method, path, payload=None, revalidate=False):
+
+        '''
+
+        Sends a request to the Zefix API and returns the decoded JSON body. Raises ZefixError if the request is not successful.
+        If the client has a cache, fresh cached responses are returned without contacting the API.
+
+        Parameters:
+        method (str): 'GET' or 'POST'
+        path (str): path of the endpoint, relative to base_url (e.g. 'firm/415520')
+        payload (dict): None by default. JSON body of the request (POST)
+        revalidate (bool): False by default. If True, the API is always asked (a cached entry is only used if the API answers that it
+                           did not change), and an expired entry is not served when the API cannot be reached
+
+        '''
+
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        key, cached = self._cache_lookup(method, path, payload)
+        if cached is not None and cached['fresh'] and not revalidate:
+            self._count_cache('hits')
+            return cached['data']
+
+        kwargs = {'headers': self._conditional_headers(cached)}
+        if payload is not None:
+            kwargs['json'] = payload
+        try:
+            r = self._send(method, url, **kwargs)
+        except ZefixError as e:
+            if revalidate:
+                raise
+            return self._cache_fallback(cached, e)
+        return self._cache_response(key, cached, r.status_code, r.headers, r.json)
+
+    def get(self, path, revalidate=False):
+        return self.request('GET', path, revalidate=revalidate)
+
+    def post(self, path, payload):
+        # the only POST endpoint used (search.json) is a read-only query, so it is retried like a GET
+        return self.request('POST', path, payload)
+
+# client shared by all the functions of this module
+_client = _ZefixClient()
+
+
+def configure_client(**kwargs):
+
+    '''
+
+    Replaces the client shared by all the functions of this module with a new one built with the given settings.
+
+    Parameters:
+    **kwargs: any parameter of _ZefixClient (base_url, retries, backoff, max_backoff, rate_limit, timeout, pool_size, cache)
+
+    Returns:
+    client (_ZefixClient): the new client
+
+    Example: configure_client(rate_limit=5, retries=5) before a large crawl.
+    Example: configure_client(cache=ZefixCache('zefix_cache.sqlite', ttl=6*60*60)) to reuse the responses between runs.
+
+    '''
+
+    global _client
+    _client = _ZefixClient(**kwargs)
+    return _client
+
+
+## TRANSLATION
+
+# english names of the statuses used by Zefix, no translation needed for these
+_STATUS_ENGLISH = {
+    'EXISTIEREND': 'Active',
+    'GELOESCHT': 'Deleted',
+    'IN_AUFLOESUNG': 'In Liquidation',
+}
+
+# googletrans translators are not thread safe: one instance per thread, reused for all its calls
+_translators = threading.local()
+
+
+def _googletrans_backend(texts):
+
+    '''
+
+    Default translation backend: translates a list of texts to english with googletrans, in one call.
+
+    Parameters:
+    texts (list of str): texts to translate
+
+    Returns:
+    translations (list of str): the english texts, in the same order
+
+    '''
+
+    if not hasattr(_translators, 'translator'):
+        from googletrans import Translator
+        _translators.translator = Translator()
+    return [result.text for result in _translators.translator.translate(texts, dest='en')]
+
+
+class _TranslationLayer:
+
+    '''
+
+    Internal translation layer used by every function of this module to translate purposes and statuses to english.
+    Identical texts are translated once: translations are memoized by text hash in an in-memory LRU and, optionally, in a ZefixCache on disk.
+    Texts not yet known are sent to the backend in batches of batch_size.
+
+    Parameters:
+    backend (callable): function taking a list of texts and returning the list of their english translations. Default: googletrans.
+    mode (str): 'translate' (default) translates right away, 'none' returns the original texts,
+                'deferred' returns the original texts and lets you translate them later with complete_translations
+    cache_size (int): number of translations kept in memory
+    cache (ZefixCache or str): None by default. A ZefixCache, or the path of its SQLite file, where translations are also stored between runs
+    batch_size (int): maximum number of texts sent to the backend in one call
+
+    '''
+
+    def __init__(self, backend=None, mode='translate', cache_size=10000, cache=None, batch_size=50):
+        if mode not in ('translate', 'none', 'deferred'):
+            raise ValueError("mode must be 'translate', 'none' or 'deferred'")
+        self.backend = backend if backend is not None else _googletrans_backend
+        self.mode = mode
+        self.cache_size = cache_size
+        self.cache = ZefixCache(cache, ttl=None, max_entries=None) if isinstance(cache, str) else cache
+        self.batch_size = batch_size
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, translation):
+        with self._lock:
+            self._memory[key] = translation
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.cache_size:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        if self.cache is not None:
+            cached = self.cache.get(f"translate {key}")
+            if cached is not None:
+                self._remember(key, cached['data'])
+                return cached['data']
+        return None
+
+    def translate(self, texts, force=False):
+
+        '''
+
+        Translates a list of texts to english and returns the translations in the same order. Empty texts are returned as they are.
+        If a batch cannot be translated, its texts are returned untranslated.
+
+        Parameters:
+        texts (list of str): texts to translate
+        force (bool): if True, translates even in 'none' and 'deferred' mode (used by complete_translations)
+
+        '''
+
+        if self.mode != 'translate' and not force:
+            return list(texts)
+
+        keys = [hashlib.sha1(text.encode('utf-8')).hexdigest() if text else None for text in texts]
+        translations = {key: self._lookup(key) for key in set(keys) if key is not None}
+
+        # texts not translated yet, each one only once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key is not None and translations[key] is None:
+                missing[key] = text
+        missing = list(missing.items())
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            try:
+                with _metrics.span('translate', texts=len(batch)):
+                    results = self.backend([text for key, text in batch])
+            except Exception as e:
+                print(f"Failed to translate {len(batch)} texts, they are kept in their original language:", repr(e))
+                continue
+            for (key, text), translation in zip(batch, results):
+                translations[key] = translation
+                self._remember(key, translation)
+                if self.cache is not None:
+                    self.cache.put(f"translate {key}", translation)
+
+        return [translations[key] if key is not None and translations[key] is not None else text for key, text in zip(keys, texts)]
+
+    def known(self, text):
+
+        '''
+
+        Returns True if text is empty or already has a translation (in memory or in the cache). A text whose batch could not be
+        translated, or that was only returned as it is ('none' and 'deferred' mode), has none.
+
+        '''
+
+        if not text:
+            return True
+        return self._lookup(hashlib.sha1(text.encode('utf-8')).hexdigest()) is not None
+
+    def status(self, status, force=False):
+
+        '''
+
+        Returns the english name of a Zefix status, e.g. 'EXISTIEREND' -> 'Active'. Unknown statuses are translated.
+
+        '''
+
+        if not status or status in _STATUS_ENGLISH.values():
+            return status
+        if status.upper() in _STATUS_ENGLISH:
+            return _STATUS_ENGLISH[status.upper()]
+        return self.translate([status], force=force)[0]
+
+
+# translation layer shared by all the functions of this module
+_translation = _TranslationLayer()
+
+
+def configure_translation(**kwargs):
+
+    '''
+
+    Replaces the translation layer shared by all the functions of this module with a new one built with the given settings.
+
+    Parameters:
+    **kwargs: any parameter of _TranslationLayer (backend, mode, cache_size, cache, batch_size)
+
+    Returns:
+    translation (_TranslationLayer): the new translation layer
+
+    Example: configure_translation(mode='none') to get the purposes in their original language, without waiting for the translations.
+    Example: configure_translation(backend=lambda texts: texts) to work offline.
+
+    '''
+
+    global _translation
+    _translation = _TranslationLayer(**kwargs)
+    return _translation
+
+
+def _translate_records(records, fields=('purpose',), force=False):
+    # translates the given fields of a list of dictionaries in place, in batches
+    for field in fields:
+        positions = [n for n in range(len(records)) if records[n].get(field)]
+        if field == 'status':
+            translations = [_translation.status(records[n][field], force=force) for n in positions]
+        else:
+            translations = _translation.translate([records[n][field] for n in positions], force=force)
+        for n, translation in zip(positions, translations):
+            records[n][field] = translation
+    return records
+
+
+def complete_translations(records, fields=('purpose', 'status')):
+
+    '''
+
+    Translates to english the fields that were left in their original language, when the translation mode is 'deferred' (or 'none').
+    Takes in the output of search_companies_named or check_acquirers.
+
+    Parameters:
+    records (list of dictionaries or DataFrame): output of search_companies_named or check_acquirers
+    fields (tuple of str): fields to translate, 'purpose' and 'status' by default
+
+    Returns:
+    records (list of dictionaries or DataFrame): the same records, with the fields translated. Lists are modified in place.
+
+    '''
+
+    # records can only be a DataFrame if pandas was already imported
+    if 'pandas' in sys.modules and isinstance(records, sys.modules['pandas'].DataFrame):
+        pd = sys.modules['pandas']
+        fields = [field for field in fields if field in records.columns]
+        translated = _translate_records(records[fields].to_dict('records'), fields, force=True)
+        # the translated columns get the same compact dtypes as in the tables built by _to_frame (e.g. status stays categorical)
+        arrow = any(isinstance(records[field].dtype, pd.ArrowDtype) for field in fields)
+        columns = _ResultColumns(fields).extend(translated).frame(arrow)
+        records = records.copy()
+        for field in fields:
+            records[field] = columns[field].array
+        return records
+
+    return _translate_records(records, fields, force=True)
+
+
+## LOCAL COMPANY STORE
+
+class CompanyStore:
+
+    '''
+
+    Optional local database of firms (SQLite file), filled while the functions of this module search and crawl the Zefix API.
+    Firm records are indexed by ehraid, legalSeat, canton, legalFormId and status, names and purposes are indexed for full text search,
+    and takeovers are kept in both directions, so that name searches, "who acquired X" and filters can be answered locally.
+
+    Once a store is set with configure_store, firm details are read from it instead of the API (if younger than ttl), and a name search
+    is answered locally when a search contained in it was already sent to the API (e.g. 'Coop' covers 'Coop Immobilien'): all the
+    firms it can match are then already known. Everything else falls back to the API, and the results are added to the store.
+
+    Parameters:
+    path (str): path of the SQLite file, created if it does not exist
+    ttl (float): None by default. If given, firm details and searches older than ttl seconds are fetched again from the API
+
+    '''
+
+    def __init__(self, path='zefix_store.sqlite', ttl=None):
+        self.path = path
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS firms (
+                ehraid INTEGER PRIMARY KEY,
+                name TEXT,
+                legalSeat TEXT,
+                canton TEXT,
+                legalFormId INTEGER,
+                status TEXT,
+                deleteDate TEXT,
+                purpose TEXT,
+                data BLOB NOT NULL,
+                complete INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS firms_legalSeat ON firms (legalSeat);
+            CREATE INDEX IF NOT EXISTS firms_canton ON firms (canton);
+            CREATE INDEX IF NOT EXISTS firms_legalFormId ON firms (legalFormId);
+            CREATE INDEX IF NOT EXISTS firms_status ON firms (status);
+
+            CREATE TABLE IF NOT EXISTS takeovers (
+                acquirer INTEGER NOT NULL,
+                acquired INTEGER NOT NULL,
+                PRIMARY KEY (acquirer, acquired)
+            );
+            CREATE INDEX IF NOT EXISTS takeovers_acquired ON takeovers (acquired);
+
+            CREATE TABLE IF NOT EXISTS searches (
+                query TEXT PRIMARY KEY,
+                searched_at REAL NOT NULL
+            );
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS firms_text USING fts5(name, purpose, tokenize='trigram');
+        ''')
+        self._db.commit()
+
+    def _upsert(self, data, complete):
+        # adds or replaces one firm, with its takeovers and its text index entry (the caller holds the lock and commits)
+        ehraid = int(data['ehraid'])
+        if not complete:
+            # a search hit never replaces the full details of a firm
+            row = self._db.execute('SELECT complete FROM firms WHERE ehraid = ?', (ehraid,)).fetchone()
+            if row is not None and row[0]:
+                return
+        self._db.execute(
+            'INSERT OR REPLACE INTO firms (ehraid, name, legalSeat, canton, legalFormId, status, deleteDate, purpose, data, complete, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (ehraid, data.get('name'), data.get('legalSeat'), data.get('canton'), data.get('legalFormId'), data.get('status'),
+             data.get('deleteDate'), data.get('purpose'), zlib.compress(json.dumps(data).encode('utf-8')), int(complete), time.time()))
+        self._db.execute('DELETE FROM firms_text WHERE rowid = ?', (ehraid,))
+        self._db.execute('INSERT INTO firms_text (rowid, name, purpose) VALUES (?, ?, ?)', (ehraid, data.get('name') or '', data.get('purpose') or ''))
+
+        if complete:
+            takeovers = [(int(element['ehraid']), ehraid) for element in data.get('wasTakenOverBy') or []]
+            takeovers += [(ehraid, int(element['ehraid'])) for element in data.get('hasTakenOver') or []]
+            self._db.executemany('INSERT OR IGNORE INTO takeovers (acquirer, acquired) VALUES (?, ?)', takeovers)
+
+    def add_firm(self, data):
+
+        '''
+
+        Adds (or updates) the details of a firm, as given by the /firm/{ehraid} endpoint.
+
+        '''
+
+        with self._lock:
+            self._upsert(data, complete=True)
+            self._db.commit()
+
+    def add_search(self, name, firms, complete=True):
+
+        '''
+
+        Adds the firms found by the name search name (as given by the search.json endpoint). If complete is True, also records that
+        the search found every firm named like that, so that covers() lets the store answer it and the longer searches containing it.
+        A search truncated by the result cap of the API (or whose completeness is not known) must be added with complete=False.
+
+        '''
+
+        with self._lock:
+            for data in firms:
+                self._upsert(data, complete=False)
+            if complete:
+                self._db.execute('INSERT OR REPLACE INTO searches (query, searched_at) VALUES (?, ?)', (name.lower(), time.time()))
+            self._db.commit()
+
+    def _fresh(self, timestamp):
+        return self.ttl is None or time.time() - timestamp <= self.ttl
+
+    def firm(self, ehraid):
+
+        '''
+
+        Returns the stored details of a firm (as given by the /firm/{ehraid} endpoint), or None if they are not stored or too old.
+
+        '''
+
+        with self._lock:
+            row = self._db.execute('SELECT data, updated_at FROM firms WHERE ehraid = ? AND complete = 1', (int(ehraid),)).fetchone()
+        if row is None or not self._fresh(row[1]):
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def covers(self, name):
+
+        '''
+
+        Returns True if a complete search contained in name (e.g. 'Coop' for 'Coop Immobilien') was already sent to the API,
+        so that search_local(name) returns all the firms the API would return.
+
+        '''
+
+        name = name.lower()
+        with self._lock:
+            rows = self._db.execute('SELECT query, searched_at FROM searches').fetchall()
+        return any(query in name and self._fresh(searched_at) for query, searched_at in rows)
+
+    def _rows(self, sql, parameters=()):
+        with self._lock:
+            rows = self._db.execute(sql, parameters).fetchall()
+        return [json.loads(zlib.decompress(row[0])) for row in rows]
+
+    def search_local(self, name):
+
+        '''
+
+        Returns the stored firms whose name contains name (not caps sensitive), as dictionaries with at least the fields of a search.json result.
+
+        '''
+
+        if len(name) >= 3:
+            # trigram index: substring search without scanning the whole table
+            pattern = '"' + name.replace('"', '""') + '"'
+            return self._rows('SELECT firms.data FROM firms_text JOIN firms ON firms.ehraid = firms_text.rowid '
+                              'WHERE firms_text MATCH ? ORDER BY firms.name', (f'name : {pattern}',))
+        escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return self._rows("SELECT data FROM firms WHERE name LIKE ? ESCAPE '\\' ORDER BY name", (f'%{escaped}%',))
+
+    def search_purpose(self, text):
+
+        '''
+
+        Returns the stored firms whose purpose contains text (at least 3 characters, not caps sensitive).
+
+        '''
+
+        pattern = '"' + text.replace('"', '""') + '"'
+        return self._rows('SELECT firms.data FROM firms_text JOIN firms ON firms.ehraid = firms_text.rowid '
+                          'WHERE firms_text MATCH ? ORDER BY firms.name', (f'purpose : {pattern}',))
+
+    def acquirers_of(self, ehraid):
+
+        '''
+
+        Returns the ehraids of the firms that took over the firm ehraid, as far as the store knows.
+
+        '''
+
+        with self._lock:
+            rows = self._db.execute('SELECT acquirer FROM takeovers WHERE acquired = ? ORDER BY acquirer', (int(ehraid),)).fetchall()
+        return [row[0] for row in rows]
+
+    def acquired_by(self, ehraid):
+
+        '''
+
+        Returns the ehraids of the firms taken over by the firm ehraid, as far as the store knows.
+
+        '''
+
+        with self._lock:
+            rows = self._db.execute('SELECT acquired FROM takeovers WHERE acquirer = ? ORDER BY acquired', (int(ehraid),)).fetchall()
+        return [row[0] for row in rows]
+
+    def filter(self, legal_seat=None, canton=None, legal_form_id=None, status=None):
+
+        '''
+
+        Returns the stored firms matching all the given filters (None means any value).
+
+        Parameters:
+        legal_seat (str): legal seat of the firm, e.g. 'Zürich'
+        canton (str): canton of the firm, e.g. 'ZH'
+        legal_form_id (int): id of the legal form, see the /legalForm endpoint
+        status (str): status as given by Zefix (e.g. 'EXISTIEREND') or in english (e.g. 'Active')
+
+        '''
+
+        english_to_zefix = {english: zefix for zefix, english in _STATUS_ENGLISH.items()}
+        filters = {'legalSeat': legal_seat, 'canton': canton, 'legalFormId': legal_form_id, 'status': english_to_zefix.get(status, status)}
+        conditions = [f'{column} = ?' for column, value in filters.items() if value is not None]
+        parameters = [value for value in filters.values() if value is not None]
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return self._rows(f'SELECT data FROM firms{where} ORDER BY name', parameters)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM firms').fetchone()[0]
+
+
+# local store used by all the functions of this module, None if not configured
+_store = None
+
+
+def configure_store(path='zefix_store.sqlite', ttl=None):
+
+    '''
+
+    Sets the local company store used by all the functions of this module, or removes it if path is None.
+
+    Parameters:
+    path (str): path of the SQLite file of the store, None to stop using a store
+    ttl (float): None by default. If given, firm details and searches older than ttl seconds are fetched again from the API
+
+    Returns:
+    store (CompanyStore): the store, or None
+
+    Example: store = configure_store('zefix_store.sqlite'), then store.acquirers_of(415520) or store.filter(legal_seat='Zürich')
+
+    '''
+
+    global _store
+    _store = CompanyStore(path, ttl) if path is not None else None
+    return _store
+
+
+## RESULT TABLES
+
+# dtypes used for the columns of the DataFrames returned by the functions of this module
+_CATEGORY_COLUMNS = ['status', 'legalForm', 'legalSeat', 'town', 'swissZipCode', 'canton']
+_INTEGER_COLUMNS = {'ehraid': 'Int64', 'legalFormId': 'Int32', 'hops': 'Int32', 'acquirer': 'Int64', 'acquired': 'Int64',
+                    'n_of_shabPub': 'Int32', 'n_of_branchOffices': 'Int32', 'n_of_oldNames': 'Int32', 'n_of_hasTakenOver': 'Int32',
+                    'root': 'Int64', 'group': 'Int32', 'ultimate_parent': 'Int64'}
+_DATE_COLUMNS = ['deleteDate']
+_BOOLEAN_COLUMNS = ['cancelled']
+
+
+class _ResultColumns:
+
+    '''
+
+    Builds a result table one column at a time: records are appended into one list per column, and the DataFrame is made from them
+    with compact dtypes: categorical for the low-cardinality fields (status, legalForm, legalSeat, town, swissZipCode), nullable integers
+    for ehraid, hops and the n_of_* counts, datetime for deleteDate and nullable boolean for cancelled.
+
+    Parameters:
+    columns (list of str): None by default. Columns of the table, in order. If None, they are taken from the records, in order of appearance.
+
+    '''
+
+    def __init__(self, columns=None):
+        self.columns = {column: [] for column in columns or []}
+        self.length = 0
+
+    def append(self, record):
+        for column in record:
+            if column not in self.columns:
+                # new column: missing for the records appended before
+                self.columns[column] = [None] * self.length
+        for column, values in self.columns.items():
+            values.append(record.get(column))
+        self.length += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+        return self
+
+    def frame(self, arrow=False):
+
+        '''
+
+        Returns the table as a pandas DataFrame with compact dtypes. If arrow is True, the columns are backed by pyarrow arrays
+        (pyarrow must be installed), the categorical ones as dictionary arrays.
+
+        '''
+
+        import pandas as pd
+
+        data = {}
+        for column, values in self.columns.items():
+            if column in _CATEGORY_COLUMNS:
+                data[column] = pd.Categorical(values)
+            elif column in _INTEGER_COLUMNS:
+                try:
+                    data[column] = pd.array(values, dtype=_INTEGER_COLUMNS[column])
+                except (TypeError, ValueError):
+                    # e.g. legalFormId replaced by the name of the legal form in check_acquirers
+                    data[column] = pd.Categorical(values)
+            elif column in _DATE_COLUMNS:
+                data[column] = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce')
+            elif column in _BOOLEAN_COLUMNS:
+                data[column] = pd.array(values, dtype='boolean')
+            else:
+                data[column] = values
+        table = pd.DataFrame(data, columns=list(self.columns))
+
+        if arrow:
+            import pyarrow as pa
+            table = table.convert_dtypes(dtype_backend='pyarrow')
+            for column in table.columns:
+                if isinstance(table[column].dtype, pd.CategoricalDtype):
+                    table[column] = table[column].astype(pd.ArrowDtype(pa.dictionary(pa.int32(), pa.string())))
+        return table
+
+
+def _to_frame(records, columns=None, arrow=False):
+    # DataFrame with compact dtypes from a list of dictionaries
+    with _metrics.span('dataframe', rows=len(records)):
+        return _ResultColumns(columns).extend(records).frame(arrow)
+
+
+## HELPERS
+
+# number of seconds after which the legal forms table is downloaded again
+LEGAL_FORMS_TTL = 24 * 60 * 60
+
+# legal forms table shared by all the functions, loaded the first time it is needed
+_legal_forms = {'dictionary': None, 'loaded_at': 0.0}
+_legal_forms_lock = threading.Lock()
+
+
+def _legal_forms_expired():
+    # True if the legal forms table was never loaded or is older than LEGAL_FORMS_TTL
+    return _legal_forms['dictionary'] is None or time.monotonic() - _legal_forms['loaded_at'] > LEGAL_FORMS_TTL
+
+
+def _set_legal_forms(legal_forms):
+    # create a dictionary with legal form id as key, shared by all the functions
+    _legal_forms['dictionary'] = {item['id']: item for item in legal_forms}
+    _legal_forms['loaded_at'] = time.monotonic()
+    return _legal_forms['dictionary']
+
+
+def _legal_forms_dictionary():
+
+    '''
+
+    Returns a dictionary with the legal form id as key and the legal form (as given by the /legalForm endpoint) as value.
+    The table is downloaded the first time it is needed and then reused by every call in the process, until it is older than LEGAL_FORMS_TTL seconds.
+    If a refresh fails, the previous table is kept. Raises ZefixError if the table was never loaded and cannot be downloaded.
+
+    '''
+
+    with _legal_forms_lock:
+        if _legal_forms_expired():
+            try:
+                _set_legal_forms(_client.get("legalForm"))
+            except ZefixError:
+                if _legal_forms['dictionary'] is None:
+                    raise
+        return _legal_forms['dictionary']
+
+
+def _fetch_all(fetch, ehraids, max_workers=1):
+
+    '''
+
+    Runs fetch(ehraid) for every ehraid, one after the other or with a pool of max_workers threads. Each ehraid is fetched only once.
+
+    Parameters:
+    fetch (function): function taking an ehraid and returning its result
+    ehraids (list): ehraids to fetch
+    max_workers (int): maximum number of ehraids fetched at the same time
+
+    Returns:
+    results (dict): ehraid -> result, for the ehraids fetched successfully
+    errors (dict): ehraid -> repr of the exception, for the ehraids that failed
+
+    '''
+
+    unique_ehraids = list(dict.fromkeys(ehraids))
+    results = {}
+    errors = {}
+    if max_workers is None or max_workers <= 1 or len(unique_ehraids) <= 1:
+        for ehraid in unique_ehraids:
+            try:
+                results[ehraid] = fetch(ehraid)
+            except Exception as e:
+                errors[ehraid] = repr(e)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch, ehraid): ehraid for ehraid in unique_ehraids}
+            for future in as_completed(futures):
+                ehraid = futures[future]
+                try:
+                    results[ehraid] = future.result()
+                except Exception as e:
+                    errors[ehraid] = repr(e)
+    return results, errors
+
+
+def _search_query(name):
+    # body of a search by name
+    return {
+        "name" : name,
+        "searchType" : "exact"
+    }
+
+
+def _search_firms(name):
+
+    '''
+
+    Sends a search by name to the Zefix API and returns the list of firms found (as given by the search.json endpoint).
+    Raises ZefixError if the request is not successful.
+
+    '''
+
+    # answer locally if the store already knows every firm this search can find
+    firms = _local_search(name)
+    if firms is not None:
+        return firms
+
+    data = _client.post('firm/search.json', _search_query(name))
+
+    # list of the companies found in the search
+    firms = list(data['list'])
+    _save_search(name, firms, _search_complete(data))
+    return firms
+
+
+def _search_complete(data):
+    # True only if the API said that an answer of search.json holds every firm of the search: a missing flag is not known to be complete
+    return data.get('hasMoreResults') is False
+
+
+def _local_search(name):
+    # firms of a search answered by the local store, None if there is no store or it does not cover the search
+    if _store is not None and _store.covers(name):
+        return _store.search_local(name)
+    return None
+
+
+def _save_search(name, firms, complete):
+    # adds the firms of a search to the local store (if any), recording the search as covered only if it is complete
+    if _store is not None:
+        _store.add_search(name, firms, complete)
+
+
+def _search_page(query):
+    # one page of a search: the whole answer of the search.json endpoint ('list', and 'hasMoreResults' when the API gives it).
+    # Used by the exhaustive search, which pages and filters the queries itself, so the local store is not used
+    return _client.post('firm/search.json', query)
+
+
+def _get_firm(ehraid):
+
+    '''
+
+    Returns the details of a firm, as given by the /firm/{ehraid} endpoint: from the local store if it has them, from the API otherwise
+    (and then they are added to the store). Raises ZefixError if the request is not successful.
+
+    '''
+
+    if _store is not None:
+        data = _store.firm(ehraid)
+        if data is not None:
+            return data
+
+    data = _client.get(f"firm/{ehraid}")
+    if _store is not None:
+        _store.add_firm(data)
+    return data
+
+
+def _get_current_firm(ehraid):
+    # details of a firm as the API gives them now, for refresh_companies: the local store and fresh cache entries are skipped
+    # (a cached entry is still used if the API answers 304 Not Modified), and the store is updated with the answer
+    data = _client.get(f"firm/{ehraid}", revalidate=True)
+    if _store is not None:
+        _store.add_firm(data)
+    return data
+
+
+def _company_record(data, legal_forms_dictionary):
+
+    '''
+
+    Builds the dictionary returned by search_companies_named for one firm, from its details (as given by the /firm/{ehraid} endpoint).
+    status and purpose are left in their original language, they are translated for all the firms at once.
+
+    Parameters:
+    data (dict): details of the firm
+    legal_forms_dictionary (dict): legal form id -> legal form, see _legal_forms_dictionary
+
+    Returns:
+    company (dict): the information about the firm, see search_companies_named for the list of fields
+
+    '''
+
+    # create empty dictionary to store the searched company information
+    company={}
+    
+    # attributes to keep
+    attributes = ['name', 'ehraid', 'legalSeat', 'cantonalExcerptWeb', 'status', 'deleteDate', 'wasTakenOverBy', 'purpose']
+
+    for attrib in attributes:
+        company[attrib] = data[attrib]
+
+    # get the English name of a legal form associated with the given ID provided by the API
+    firm_legal_form_name = legal_forms_dictionary[data['legalFormId']]['name']['en']
+
+    # fill the legalForm field in the dictionary with the english name we just found
+    company['legalForm'] = firm_legal_form_name 
+    
+    # cancelled field      
+    if data['deleteDate'] is not None:
+        company['cancelled'] = True
+    else:
+        company['cancelled'] = False
+    
+    # defining all the 'n_...' attributes by counting 
+    len_fields = [ 'shabPub', 'branchOffices', 'oldNames', 'hasTakenOver']
+    for field in len_fields:
+        if data[field] is not None:
+            company[f"n_of_{field}"] = len(data[field])
+        else:
+            company[f"n_of_{field}"] = 0
+    
+    # town/swissZipCode fields
+    company['town'] = data['address']['town']
+    company['swissZipCode'] = data['address']['swissZipCode']
+
+    return company
+
+
+def _company_details(ehraid):
+
+    '''
+
+    Fetches the record of a single firm and returns the enriched dictionary used by search_companies_named, with the status translated.
+    Used as the unit of work of the streaming and bulk functions.
+
+    '''
+
+    company = _company_record(_get_firm(ehraid), _legal_forms_dictionary())
+    _translate_records([company], ['status'])
+    return company
+
+
+## CORE
+
+# search_companies_named, get_acquisitions_data and check_acquirers (and their async versions) are written once, as generators that
+# do no I/O themselves: they yield what they need and receive the answer. _run answers with the blocking client and a thread pool,
+# _arun with the asyncio client, so the sync and async functions always return the same results. The requests are:
+#
+# ('search', name)              -> list of firms found by the search.json endpoint
+# ('search_page', query)        -> answer of the search.json endpoint to the query, ZefixError is raised into the generator if it fails
+# ('local_search', name)        -> firms of the search from the local store, None if it does not cover the search
+# ('save_search', name, firms, complete) -> None, the firms of a search are added to the local store (if any), see _save_search
+# ('search_pages', queries)     -> (results, errors): position of the query -> answer, position of the query -> repr of the exception
+# ('firm', ehraid)              -> details of one firm, ZefixError is raised into the generator if it cannot be fetched
+# ('firms', ehraids)            -> (results, errors): ehraid -> details, ehraid -> repr of the exception
+# ('legal_forms',)              -> legal form id -> legal form, ZefixError is raised into the generator if it cannot be fetched
+# ('translate', records, fields) -> the records, with the fields translated in place
+
+def _answer(request, max_workers):
+    # answers a request of a core generator with the blocking client
+    kind = request[0]
+    if kind == 'search':
+        with _metrics.span('search'):
+            return _search_firms(request[1])
+    if kind == 'search_page':
+        with _metrics.span('search'):
+            return _search_page(request[1])
+    if kind == 'search_pages':
+        queries = request[1]
+        with _metrics.span('search_pages', queries=len(queries)):
+            return _fetch_all(lambda position: _search_page(queries[position]), list(range(len(queries))), max_workers)
+    if kind == 'firm':
+        with _metrics.span('firm'):
+            return _get_firm(request[1])
+    if kind == 'firms':
+        with _metrics.span('firms', firms=len(request[1])):
+            return _fetch_all(_get_firm, request[1], max_workers)
+    if kind == 'legal_forms':
+        with _metrics.span('legal_forms'):
+            return _legal_forms_dictionary()
+    if kind == 'translate':
+        return _translate_records(request[1], request[2])
+    if kind == 'local_search':
+        return _local_search(request[1])
+    if kind == 'save_search':
+        return _save_search(request[1], request[2], request[3])
+    raise ValueError(f"Unknown request {kind}")
+
+
+def _run(core, max_workers=1):
+
+    '''
+
+    Runs a core generator with the blocking client, fetching lists of firms with up to max_workers threads, and returns its result.
+
+    '''
+
+    answer, error = None, None
+    while True:
+        try:
+            request = core.throw(error) if error is not None else core.send(answer)
+        except StopIteration as stop:
+            return stop.value
+        answer, error = None, None
+        try:
+            answer = _answer(request, max_workers)
+        except ZefixError as e:
+            error = e
+
 
 ## FUNCTION 1
-def search_companies_named(name, simple=False, save=False, df=True):
+
+# number of firms asked for in each page of an exhaustive search
+_SEARCH_PAGE_SIZE = 500
+
+# the 26 cantons, used to split an exhaustive search that hits the result cap of search.json
+_CANTONS = ['AG', 'AI', 'AR', 'BE', 'BL', 'BS', 'FR', 'GE', 'GL', 'GR', 'JU', 'LU', 'NE',
+            'NW', 'OW', 'SG', 'SH', 'SO', 'SZ', 'TG', 'TI', 'UR', 'VD', 'VS', 'ZG', 'ZH']
+
+# ways of splitting an exhaustive search, in the order they are used: filter of the search.json body for each of them.
+# Each one splits the firms into disjoint groups that together hold all of them (so status is not used: search.json only has activeOnly)
+_SHARD_FIELDS = {'canton': 'cantons', 'legalForm': 'legalForms'}
+
+
+def _exhaustive_search_core(name, report=None):
+
+    '''
+
+    Finds every firm whose name matches name, even when the search hits the result cap of search.json, as a core generator (see ## CORE).
+
+    The search is first sent as it is. If it reports more results than a page holds, it is split by canton, and the cantons that are still
+    too broad by legal form; the searches that cannot be split further are paged through with offset. Every round of searches is sent at once
+    ('search_pages'), so they run concurrently. The firms are deduplicated by ehraid and keep the order in which they were found.
+    ZefixError is raised if the first search is not successful. With a local store (configure_store), a search the store covers is
+    answered from it, and a complete search is recorded in it so that it covers the longer searches containing it.
+
+    If report is a dictionary, it is filled with:
+    'complete' (bool): False if some firms may be missing (a search failed, could not be paged past the cap, or its completeness is unknown)
+    'firms' (int): number of distinct firms found
+    'queries' (int): number of searches sent
+    'truncated' (list): filters of the searches that still hit the cap
+    'unknown' (list): filters of the searches whose last page did not say if there are more results (no hasMoreResults in the answer)
+    'errors' (list): {'filters': ..., 'error': ...} for every search that failed
+
+    '''
+
+    shard_by = list(_SHARD_FIELDS)
+    legal_form_ids = None
+    firms = {}
+    truncated = []
+    unknown = []
+    failed = []
+
+    def query(filters, offset):
+        return dict(_search_query(name), maxEntries=_SEARCH_PAGE_SIZE, offset=offset, **filters)
+
+    # a complete search already in the local store answers it without asking the API
+    stored = yield ('local_search', name)
+    if stored is not None:
+        if report is not None:
+            report.update({'complete': True, 'firms': len(stored), 'queries': 0, 'truncated': [], 'unknown': [], 'errors': []})
+        return stored
+
+    # one round: (filters, number of split dimensions used, offset, ehraids already seen by this search)
+    first = yield ('search_page', query({}, 0))
+    answers = {0: first}
+    errors_by_position = {}
+    searches = [({}, 0, 0, set())]
+    queries = 1
+
+    while True:
+        next_searches = []
+        split = []
+        for position, (filters, depth, offset, seen) in enumerate(searches):
+            if position in errors_by_position:
+                failed.append({'filters': filters, 'error': errors_by_position[position]})
+                continue
+            page = answers[position].get('list') or []
+            ehraids = [firm['ehraid'] for firm in page]
+            new = [ehraid for ehraid in ehraids if ehraid not in seen]
+            for firm in page:
+                firms.setdefault(firm['ehraid'], firm)
+            more = answers[position].get('hasMoreResults')
+            if more is None:
+                # the API did not say: a full page is worth going on with, but a shorter one may just as well be cut by a cap below
+                # the page size, so the search is reported as not known to be complete instead of complete
+                more = len(page) >= _SEARCH_PAGE_SIZE
+                if not more:
+                    unknown.append(filters)
+            if not more:
+                continue
+            if offset == 0 and depth < len(shard_by):
+                # too broad: split it by the next dimension
+                split.append((filters, depth))
+            elif new:
+                next_searches.append((filters, depth, offset + len(page), seen.union(new)))
+            else:
+                # the search cannot be paged further (empty page, or the same firms again): some of its firms are out of reach
+                truncated.append(filters)
+
+        for filters, depth in split:
+            field = _SHARD_FIELDS[shard_by[depth]]
+            if shard_by[depth] == 'legalForm':
+                if legal_form_ids is None:
+                    try:
+                        legal_form_ids = list((yield ('legal_forms',)))
+                    except ZefixError as e:
+                        failed.append({'filters': filters, 'error': repr(e)})
+                        continue
+                values = legal_form_ids
+            else:
+                values = _CANTONS
+            next_searches.extend((dict(filters, **{field: [value]}), depth + 1, 0, set()) for value in values)
+
+        if not next_searches:
+            break
+        searches = next_searches
+        answers, errors_by_position = yield ('search_pages', [query(filters, offset) for filters, depth, offset, seen in searches])
+        queries += len(searches)
+
+    complete = not truncated and not unknown and not failed
+    if not complete:
+        print(f"The search for {name!r} may be incomplete: {len(truncated)} searches still hit the result cap, "
+              f"{len(unknown)} did not say if they had more results and {len(failed)} failed.")
+    if report is not None:
+        report.update({'complete': complete, 'firms': len(firms), 'queries': queries, 'truncated': truncated, 'unknown': unknown,
+                       'errors': failed})
+    firms = list(firms.values())
+    yield ('save_search', name, firms, complete)
+    return firms
+
+
+def _search_core(name, simple, save, df, errors, arrow, exhaustive=False, report=None):
+    # search_companies_named, as a core generator (see ## CORE)
+
+    # check if input is a string
+    if type(name) != str:
+        return "Please provide a string of the name of the company (or part of it) as input. Example: 'UBS' returns information about all companies with 'UBS' in their name."
+    
+    # access the information, return error message if the request was not successful
+    try:
+        if exhaustive:
+            firm_data = yield from _exhaustive_search_core(name, report)
+        else:
+            firm_data = yield ('search', name)
+    except ZefixError as e:
+        return e.message
+
+    # create an empty list to store the results for each of the companies found in the search
+    list_of_companies = []
+
+    # if option simple is true, return the simplified version of the dictionary
+    if simple==True:
+        for n in range(len(firm_data)):
+            company = {}
+
+            company['name'] = firm_data[n]['name']
+
+            company['ehraid'] = firm_data[n]['ehraid']
+
+            company['legalSeat'] = firm_data[n]['legalSeat']
+
+            company['cantonalExcerptWeb'] = firm_data[n]['cantonalExcerptWeb']
+
+            list_of_companies.append(company)
+
+        # Save data to JSON file if option save is True
+        if simple == True and save == True:
+            with open(f'{name}_companies_simple.json', 'w') as file:
+                json.dump(list_of_companies, file, indent=4)
+            print(f"Data saved to {name}_companies_simple.json")
+        
+        # dataframe option
+        if df==True:
+            list_of_companies = _to_frame(list_of_companies, arrow=arrow)
+        
+        return list_of_companies
+    
+    # ehraids of the companies found in the search, in the same order as the search list
+    ehraids = [firm['ehraid'] for firm in firm_data]
+
+    # fetch the details of every firm, one after the other or max_workers at a time.
+    # results are put back by position so that the output keeps the order of the search list
+    # every ehraid is fetched only once, even if it appears several times in the search list
+    unique_ehraids = list(dict.fromkeys(ehraids))
+    try:
+        legal_forms_dictionary = yield ('legal_forms',)
+        firms, errors_by_ehraid = yield ('firms', unique_ehraids)
+    except ZefixError as e:
+        # without the legal forms no firm can be completed
+        firms, errors_by_ehraid = {}, {ehraid: repr(e) for ehraid in unique_ehraids}
+
+    details = {}
+    for ehraid, data in firms.items():
+        try:
+            details[ehraid] = _company_record(data, legal_forms_dictionary)
+        except Exception as e:
+            errors_by_ehraid[ehraid] = repr(e)
+
+    results = [details.get(ehraid) for ehraid in ehraids]
+    failures = [{'ehraid': ehraid, 'error': errors_by_ehraid[ehraid]} if ehraid in errors_by_ehraid else None for ehraid in unique_ehraids]
+
+    # firms that could not be fetched are left out of the results and reported instead of aborting the whole search
+    failed = [failure for failure in failures if failure is not None]
+    if failed:
+        print(f"Failed to fetch details for {len(failed)} of {len(unique_ehraids)} companies:", [f['ehraid'] for f in failed])
+        if errors is not None:
+            errors.extend(failed)
+
+    list_of_companies = [company for company in results if company is not None]
+
+    #translate the information in 'status' and 'purpose' to english, all the firms at once (identical texts are translated once)
+    yield ('translate', list_of_companies, ['status', 'purpose'])
+
+    # Save data to JSON file if option save is True
+    if save == True:
+        with open(f'{name}_companies.json', 'w') as file:
+            json.dump(list_of_companies, file, indent=4)
+        print(f"Data saved to {name}_companies.json")        
+
+    # dataframe option
+    if df==True:
+        list_of_companies = _to_frame(list_of_companies, arrow=arrow)
+
+    return list_of_companies
+
+
+def search_companies_named(name, simple=False, save=False, df=True, max_workers=1, errors=None, arrow=False, exhaustive=False, report=None):
+
+    '''
+
+    Takes in a company name or part of it (string) and returns a dataframe with information about all companies named like that.
+
+    Parameters:
+    name (str): name of the company (or part of it) to search for. Not caps sensitive.
+    simple (bool): False by default. If True, returns a simplified version of the dictionary with only the name, ehraid, and legalSeat of the company.
+    save (bool): False by default. If True, saves the data to a JSON file called "name_companies.json". If simple is also True at the same time, saves the data to a JSON file called "name_companies_simple.json" instead.
+    df (bool): True by default. If True, returns the data as a pandas DataFrame. If False, returns the data as a list of dictionaries.
+    max_workers (int): 1 by default. Maximum number of firms whose details are fetched at the same time. With values above 1 the requests run in parallel in a thread pool; the results keep the order of the search.
+    errors (list): None by default. If a list is given, every firm that could not be fetched is appended to it as a dictionary {'ehraid': ..., 'error': ...}. Failed firms are left out of the results instead of stopping the whole search.
+    arrow (bool): False by default. If True (and df=True), the columns of the DataFrame are backed by pyarrow arrays. Needs pyarrow.
+    exhaustive (bool): False by default. A single search returns at most a capped number of firms, so very common names are truncated.
+                       If True, the search is paged and, when it is too broad, split by canton and legal form (up to max_workers
+                       searches at the same time), so that every firm named like that is found. Each firm is returned only once.
+    report (dict): None by default. If a dictionary is given with exhaustive=True, it is filled with 'complete' (False if some firms
+                   may still be missing), 'firms', 'queries', 'truncated', 'unknown' and 'errors', see _exhaustive_search_core.
+
+    Returns:
+    
+    if df=False: 
+    list_of_companies (list): a list of dictionaries, each containing information about a company found in the search
+
+    if df=True (default): 
+    list_of_companies (DataFrame): a pandas DataFrame containing information about all companies found in the search.
+    status, legalForm, legalSeat, town and swissZipCode are categorical columns, the n_of_* counts are nullable integers and deleteDate is a datetime.
+
+    The dataframe in the list will contain the following information about the company:
+
+    'name':                 <-- name of the company,
+    'ehraid':               <-- unique identifier of the company,
+    'legalSeat':            <-- location of the company's legal seat,
+    'status':               <-- status of the company (active or not),
+    'deleteDate':           <-- date when the company was deleted (if applicable),
+    'wasTakenOverBy':       <-- name of the company that took over this one (if applicable),
+    'purpose':              <-- purpose of the company,
+    'legalForm':            <-- legal form of the company,
+    'cancelled':            <-- boolean value indicating if the company is cancelled or not,
+    'n_of_shabPub':         <-- number of publications in the Swiss Official Gazette of Commerce,
+    'n_of_branchOffices':   <-- number of branch offices of the company,
+    'n_of_oldNames':        <-- number of old names of the company,
+    'n_of_hasTakenOver':    <-- number of companies taken over by this one,
+    'town':                 <-- town where the company is located,
+    'swissZipCode':         <-- Swiss zip code of the company,
+
+    if simple=True, the dataframe/list of dictionaries will only contain the following:
+
+    'name':                 <-- name of the company,
+    'ehraid':               <-- unique identifier of the company,
+    'legalSeat':            <-- location of the company's legal seat,
+
+    '''
+    with _metrics.span('search_companies_named'):
+        return _run(_search_core(name, simple, save, df, errors, arrow, exhaustive, report), max_workers)
+
+## FUNCTION 2
+def _acquisition_record(data, hops):
+    # Extract data of firm as a dictionary, with the number of hops from the initial ehraid
+    firm = {
+        "name": data.get("name"),
+        "ehraid": data.get("ehraid"),
+        "legalSeat": data.get("legalSeat"),
+        "legalFormId": data.get("legalFormId"),
+        "status": data.get("status"),
+        "cantonalExcerptWeb": data.get("cantonalExcerptWeb"),
+        "deleteDate": data.get("deleteDate"),
+        "hops": hops
+    }
+
+    return firm
+
+
+def _acquisitions_core(ehraid, hops, save, df, max_hops, max_nodes, return_edges, errors, arrow):
+    # get_acquisitions_data, as a core generator (see ## CORE)
+
+    acquisitions = []
+    edges = []
+    failed = []
+
+    # check if ehraid is a dictionary: if it is, get it as a string
+    ehraid = ehraid.get('ehraid') if isinstance(ehraid, dict) else ehraid
+
+    # get the data of the firm with the given ehraid from the API 
+    # return error message if the request was not successful
+    try:
+        data = yield ('firm', ehraid)
+    except ZefixError as e:
+        return e.message
+
+    acquisitions.append(_acquisition_record(data, hops))
+
+    # firms already found, the ones in frontier are the ones whose takeovers still have to be explored
+    visited = {data.get("ehraid")}
+    frontier = [data]
+    level = hops
+
+    while frontier and (max_hops is None or level - hops < max_hops):
+
+        # takeovers of the firms of this level, new firms are fetched only once
+        new_ehraids = []
+        for acquirer in frontier:
+            for element in acquirer.get("hasTakenOver") or []:
+                acquired = element.get('ehraid') if isinstance(element, dict) else element
+                if acquired in visited:
+                    # firm already found: record the takeover, do not explore it again
+                    edges.append({'acquirer': acquirer.get("ehraid"), 'acquired': acquired, 'hops': level + 1})
+                    continue
+                if max_nodes is not None and len(visited) >= max_nodes:
+                    continue
+                visited.add(acquired)
+                new_ehraids.append(acquired)
+                edges.append({'acquirer': acquirer.get("ehraid"), 'acquired': acquired, 'hops': level + 1})
+
+        # fetch all the new firms of the next level
+        results, errors_by_ehraid = yield ('firms', new_ehraids)
+        failed.extend({'ehraid': e, 'error': errors_by_ehraid[e]} for e in new_ehraids if e in errors_by_ehraid)
+
+        level += 1
+        frontier = [results[e] for e in new_ehraids if e in results]
+        acquisitions.extend(_acquisition_record(firm_data, level) for firm_data in frontier)
+
+    # firms that could not be fetched are left out, together with their takeovers
+    if failed:
+        print(f"Failed to fetch details for {len(failed)} companies:", [f['ehraid'] for f in failed])
+        failed_ehraids = {f['ehraid'] for f in failed}
+        edges = [edge for edge in edges if edge['acquired'] not in failed_ehraids]
+        if errors is not None:
+            errors.extend(failed)
+
+    # translate the information in 'status' to english
+    yield ('translate', acquisitions, ['status'])
+
+    # Save data to JSON file if user 
+    if save == True:
+        with open('takeovers.json', 'w') as file:
+            json.dump(acquisitions, file, indent=4)
+        print("Data saved to takeovers.json")
+        if return_edges == True:
+            with open('takeovers_edges.json', 'w') as file:
+                json.dump(edges, file, indent=4)
+            print("Data saved to takeovers_edges.json")
+
+    if df==True:
+        acquisitions = _to_frame(acquisitions, arrow=arrow)
+        edges = _to_frame(edges, columns=['acquirer', 'acquired', 'hops'], arrow=arrow)
+
+    if return_edges == True:
+        return acquisitions, edges
+
+    return acquisitions
+
+
+def get_acquisitions_data(ehraid, hops=0, save=False, df=False, max_hops=None, max_nodes=None, max_workers=1, return_edges=False, errors=None, arrow=False):
+
+
+    '''
+
+    Takes in an ehraid (string) and returns a list of dictionaries with information about the firm and all the firms it has taken over. 
+    This function finds both direct and indirect acquisitions. For example, if firm A has taken over firm B, and firm B has taken over firm C, 
+    the function will return information about firm A, firm B, and firm C. Starting from A, the function will count the number of "hops" to reach
+    the last firm in the chain. The function has an option to save the data to a JSON file.
+
+    The takeover tree is explored breadth first, one level of hops at a time. Every firm is fetched only once, even if it appears in several
+    branches or in a cycle, and it is listed at the smallest number of hops at which it is found.
+    
+    Parameters:
+    ehraid (str): ehraid of the firm to start from
+    hops (int): 0 by default. Number of hops given to the initial firm, the other firms are counted from there
+    save (bool): if True, saves the data to a JSON file called 'takeovers.json' (and the edges to 'takeovers_edges.json' if return_edges is True)
+    df (bool): if True, returns the data as a pandas DataFrame
+    max_hops (int): None by default. If given, firms further than max_hops hops from the initial firm are not explored
+    max_nodes (int): None by default. If given, at most max_nodes firms are fetched
+    max_workers (int): 1 by default. Maximum number of firms of the same level fetched at the same time
+    return_edges (bool): False by default. If True, also returns the list of takeovers between the firms found
+    errors (list): None by default. If a list is given, every firm that could not be fetched is appended to it as a dictionary {'ehraid': ..., 'error': ...}
+    arrow (bool): False by default. If True (and df=True), the columns of the DataFrames are backed by pyarrow arrays. Needs pyarrow.
+
+    Returns:
+
+    if df=False (default):
+    acquisitions (list): a list of dictionaries, each containing information about a firm and the firms it has taken over
+
+    if df=True:
+    acquisitions (DataFrame): a pandas DataFrame containing information about all firms and the firms they have taken over
+
+    if return_edges=True, a tuple (acquisitions, edges) is returned instead. edges (list or DataFrame, following df) contains one entry
+    per takeover between two firms of acquisitions:
+
+    'acquirer':             <-- ehraid of the firm that took over the other one,
+    'acquired':             <-- ehraid of the firm taken over,
+    'hops':                 <-- number of hops of the acquired firm reached through this takeover (hops of the acquirer + 1),
+    
+    '''
+    
+
+    with _metrics.span('get_acquisitions_data'):
+        return _run(_acquisitions_core(ehraid, hops, save, df, max_hops, max_nodes, return_edges, errors, arrow), max_workers)
+
+## FUNCTION 3
+
+def _acquisitions_layout(hops, edges, max_children=None, max_hops=None):
+
+    '''
+
+    Layered layout of an acquisition graph, used by plot_acquisitions. Every firm hangs from its first acquirer found one hop closer
+    to the initial firm (spanning tree of the graph); the x of a firm is its number of hops, leaves get consecutive y values and
+    each acquirer is centered on the firms it has taken over. Firms beyond max_children / max_hops are collapsed into summary nodes.
+
+    Parameters:
+    hops (dict): ehraid -> number of hops of every firm
+    edges (list of tuples): (acquirer, acquired) takeovers between the firms
+    max_children (int): None by default. If given, at most max_children firms taken over are shown under each firm
+    max_hops (int): None by default. If given, firms further than max_hops hops from their root are not shown
+
+    Returns:
+    positions (dict): (x, y) of every node shown; the keys are ehraids, and ('more', ehraid) for the summary node under ehraid
+    tree_edges (list of tuples): (acquirer, acquired) edges of the spanning tree between the nodes shown, summary nodes included
+    collapsed (dict): ('more', ehraid) -> number of firms collapsed in that summary node
+
+    '''
+
+    # spanning tree: the first acquirer found one hop before a firm is its parent
+    children = {ehraid: [] for ehraid in hops}
+    parent = {}
+    for acquirer, acquired in edges:
+        if acquired not in parent and acquirer in hops and acquired in hops and hops[acquirer] < hops[acquired]:
+            parent[acquired] = acquirer
+            children[acquirer].append(acquired)
+    roots = sorted((ehraid for ehraid in hops if ehraid not in parent), key=lambda ehraid: hops[ehraid])
+
+    # size of the subtree of every firm, children before parents (no recursion, chains can be thousands of firms long)
+    order = []
+    stack = list(reversed(roots))
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(reversed(children[node]))
+    size = {}
+    for node in reversed(order):
+        size[node] = 1 + sum(size[child] for child in children[node])
+
+    # children shown under each node: the largest subtrees first are kept, the others are collapsed in one summary node
+    shown = {}
+    collapsed = {}
+    stack = [(root, hops[root]) for root in reversed(roots)]
+    while stack:
+        node, root_hops = stack.pop()
+        kept = children[node]
+        if max_hops is not None and hops[node] - root_hops >= max_hops:
+            kept = []
+        elif max_children is not None and len(kept) > max_children:
+            kept = sorted(kept, key=lambda child: -size[child])[:max_children]
+            kept_set = set(kept)
+            kept = [child for child in children[node] if child in kept_set]
+        hidden = size[node] - 1 - sum(size[child] for child in kept)
+        shown[node] = list(kept)
+        if hidden:
+            shown[node].append(('more', node))
+            shown[('more', node)] = []
+            collapsed[('more', node)] = hidden
+        stack.extend((child, root_hops) for child in reversed(kept))
+
+    def x_of(node):
+        return hops[node[1]] + 1 if isinstance(node, tuple) else hops[node]
+
+    # y: leaves one after the other, acquirers in the middle of their children (post-order, without recursion)
+    positions = {}
+    next_y = 0
+    stack = [(root, False) for root in reversed(roots)]
+    while stack:
+        node, done = stack.pop()
+        if not shown[node]:
+            positions[node] = (x_of(node), next_y)
+            next_y += 1
+        elif done:
+            positions[node] = (x_of(node), (positions[shown[node][0]][1] + positions[shown[node][-1]][1]) / 2)
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(shown[node]))
+
+    tree_edges = [(node, child) for node in shown for child in shown[node]]
+    return positions, tree_edges, collapsed
+
+
+def plot_acquisitions(acquisitions, edges=None, path=None, max_children=None, max_hops=None, max_labels=300, figsize=None):
+    
+    '''
+
+    Takes in a list of dictionaries with information about firms and their acquisitions (output of the function acquisitions_data) and plots the acquisitions on a graph.
+    From left to right, the x axis represents the number of acquisition "hops" from the initial firm. 
+
+    If the takeovers between the firms are given (edges), the firms are drawn as a tree: each firm is linked to the firm that took it over,
+    and takeovers between firms of different branches are drawn as dashed lines. Nodes and links are drawn as collections, so that
+    groups with thousands of firms are drawn in seconds, and large subtrees can be collapsed into a single node with max_children and max_hops.
+    
+    Parameters:
+    acquisitions (list of dictionaries): list of dictionaries with information about firms and their acquisitions. You can get data structured this way running the function acquisitions_data from the same package as this one.
+    edges (list of dictionaries or DataFrame): None by default. Takeovers between the firms, as returned by get_acquisitions_data with return_edges=True
+    path (str): None by default. If given, the plot is saved to this file (the format is taken from the extension: .png, .svg, .pdf) without opening a window
+    max_children (int): None by default. If given (with edges), at most max_children firms are shown under each firm, the others are shown as one "+N firms" node
+    max_hops (int): None by default. If given (with edges), firms further than max_hops hops are shown as one "+N firms" node under their acquirer
+    max_labels (int): 300 by default. Names are written only if there are at most max_labels firms on the plot
+    figsize (tuple): None by default. Size of the figure in inches, computed from the number of firms if not given
+
+    Returns:
+    path (str): the path of the saved file, if path is given
+    
+    '''
+
+
+    if type(acquisitions) != list:
+        return "Please provide a list of dictionaries with information about firms and their acquisitions as input. You can get this data by running the function acquisitions_data in this same package. Use the default option df=False"
+    
+    if type(acquisitions[0]) != dict:
+        return "Please provide a list of dictionaries with information about firms and their acquisitions as input. You can get this data by running the function acquisitions_data in this same package. Use the default option df=False"
+
+    if not ('hops' in acquisitions[0] and type(acquisitions[0]['hops']) == int):
+        return "Please provide a list of dictionaries with information about firms and their acquisitions as input. You can get this data by running the function acquisitions_data in this same package. Use the default option df=False"
+
+    from matplotlib.collections import LineCollection
+    from matplotlib.ticker import MaxNLocator
+
+    names = {firm['ehraid']: firm['name'] for firm in acquisitions}
+    hops = {firm['ehraid']: int(firm['hops']) for firm in acquisitions}
+    statuses = {firm['ehraid']: firm.get('status') for firm in acquisitions}
+
+    if edges is None:
+        # no takeovers given: firms in columns by number of hops, one above the other, as in the first version of this function
+        positions = {}
+        column = {}
+        for firm in acquisitions:
+            positions[firm['ehraid']] = (firm['hops'], column.get(firm['hops'], 0) + 0.2)
+            column[firm['hops']] = column.get(firm['hops'], 0) + 1
+        tree_edges, extra_edges, collapsed = [], [], {}
+    else:
+        if hasattr(edges, 'to_dict'):
+            edges = edges.to_dict('records')
+        pairs = [(edge['acquirer'], edge['acquired']) for edge in edges]
+        positions, tree_edges, collapsed = _acquisitions_layout(hops, pairs, max_children, max_hops)
+        tree_set = set(tree_edges)
+        extra_edges = [pair for pair in pairs if pair not in tree_set and pair[0] in positions and pair[1] in positions and pair[0] != pair[1]]
+
+    firms = [node for node in positions if not isinstance(node, tuple)]
+    max_x = max(x for x, y in positions.values())
+    max_y = max(y for x, y in positions.values())
+
+    if figsize is None:
+        # wide enough for the names of each level, tall enough for one row of text per firm (within what an image can hold)
+        figsize = (min(max(15, 3 * (max_x + 1)), 150), min(max(10, 0.25 * (max_y + 1)), 150))
+
+    if path is None:
+        import matplotlib.pyplot as plt
+        figure = plt.figure(figsize=figsize)
+    else:
+        # no pyplot: the figure is drawn directly by the Agg renderer, so it works without a display
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=figsize)
+    ax = figure.add_subplot()
+
+    # all the links in two artists: takeovers of the tree, and dashed takeovers between branches
+    if tree_edges:
+        ax.add_collection(LineCollection([(positions[a], positions[b]) for a, b in tree_edges], colors='#9aa5b1', linewidths=0.8, zorder=1))
+    if extra_edges:
+        ax.add_collection(LineCollection([(positions[a], positions[b]) for a, b in extra_edges], colors='#d08770', linewidths=0.6, linestyles='dashed', zorder=1))
+
+    # all the firms in one artist, deleted firms in grey; the collapsed subtrees in another one
+    ax.scatter([positions[firm][0] for firm in firms], [positions[firm][1] for firm in firms], s=12, zorder=2, alpha=0 if edges is None else 1,
+               c=['#b0b0b0' if statuses.get(firm) in ('GELOESCHT', 'Deleted') else '#2e6fba' for firm in firms])
+    if collapsed:
+        ax.scatter([positions[node][0] for node in collapsed], [positions[node][1] for node in collapsed], s=40, marker='s', c='#e0a030', zorder=2)
+
+    # names only when they can be read
+    if len(positions) <= max_labels:
+        for firm in firms:
+            ax.text(positions[firm][0], positions[firm][1], f" {names[firm]}" if edges is not None else names[firm], ha='left' if edges is not None else 'center',
+                    va='center' if edges is not None else 'bottom', fontsize=8, wrap=True)
+        for node, count in collapsed.items():
+            ax.text(positions[node][0], positions[node][1], f" +{count} firms", ha='left', va='center', fontsize=8, style='italic')
+
+    #the size of the plot depends on the number of hops (for width) and the number of y (for height)
+    ax.set_xlim(-0.5 if edges is not None else 0, max_x + 1)
+    ax.set_ylim(-1 if edges is not None else 0, max_y + 1)
+    if edges is not None:
+        # the initial firm on top
+        ax.invert_yaxis()
+
+    #add label of the x axis, with only integer values
+    ax.set_xlabel('Number of Hops')
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+
+    #add title, hide the y axis ticks and the borders
+    ax.set_title('Acquisitions')
+    ax.set_yticks([])
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+    if path is not None:
+        figure.savefig(path, bbox_inches='tight')
+        return path
+
+    #show the plot
+    plt.show()
+    
+## FUNCTION 4
+def _acquirers_core(ehraid, df, arrow):
+    # check_acquirers, as a core generator (see ## CORE)
+
+    if type(ehraid) != str:
+        return "Please provide a string of the EHRAID of the company as input. Example: '110662'"
+
+    try:
+        data = yield ('firm', ehraid)
+    except ZefixError as e:
+        print(f"Failed to fetch details for EHRAID {ehraid}:", e.message)
+        return None
+    
+    was_taken_over_by = data.get('wasTakenOverBy', [])
+    if not was_taken_over_by:
+        print(f"No acquisition records found for EHRAID {ehraid}.")
+        return None
+    
+    # get the legal form names from the API
+    try:
+        legal_forms_dictionary = yield ('legal_forms',)
+    except ZefixError:
+        legal_forms_dictionary = None
+        print("Failed to fetch details for legal forms. The legal form will be provided as a numeric id. Read the zefix documentation for further details on what that id means.")
+    
+    
+    # search the details for the acquirer company and save them
+    acquirers = []
+
+    # each acquirer is fetched only once, even if it is listed several times
+    was_taken_over_by = list({acquirer['ehraid']: acquirer for acquirer in was_taken_over_by}.values())
+    acquirers_data, errors_by_ehraid = yield ('firms', [acquirer['ehraid'] for acquirer in was_taken_over_by])
+    for acquirer in was_taken_over_by:
+        if acquirer['ehraid'] in errors_by_ehraid:
+            print(f"Failed to fetch details for acquirer EHRAID {acquirer['ehraid']}:", errors_by_ehraid[acquirer['ehraid']])
+            continue
+        acquirer_data = acquirers_data[acquirer['ehraid']]
+
+        # Here we specify the information we are looking for
+
+        if legal_forms_dictionary is not None:
+            # get the English name of the legal form of the acquirer
+            firm_legal_form_name = legal_forms_dictionary[acquirer_data['legalFormId']]['name']['en']
+
+        record = {
+            'name': acquirer_data['name'],
+            'ehraid': acquirer_data['ehraid'],
+            'legalSeat': acquirer_data.get('legalSeat'),
+            "legalFormId": acquirer_data.get("legalFormId") if legal_forms_dictionary is None else firm_legal_form_name ,
+            'status': acquirer_data.get('status'),
+            "cantonalExcerptWeb": acquirer_data.get("cantonalExcerptWeb"),
+            'deleteDate': acquirer_data.get('deleteDate'),
+            'purpose':acquirer_data.get('purpose'),
+            'capitalNominal':acquirer_data.get('capitalNominal'),
+            }
+
+        acquirers.append(record)
+
+    #translate the information in 'status' and 'purpose' to english, all the acquirers at once
+    yield ('translate', acquirers, ['status', 'purpose'])
+         
+    if df==True:
+        acquirers = _to_frame(acquirers, arrow=arrow)
+
+    return acquirers
+
+
+#This function checks a specific company (identified by its EHRAID) acquirers.
+def check_acquirers(ehraid, df=True, arrow=False, max_workers=1):
+    
+    '''
+    
+    This function takes in the EHRAID of a company and returns a list of dictionaries with information about the companies that took over the given company.
+
+    Parameters:
+    ehraid (str): EHRAID of the company to check the acquirers for.
+    df (bool): True by default. If True, returns the data as a pandas DataFrame. If False, returns the data as a list of dictionaries.
+    arrow (bool): False by default. If True (and df=True), the columns of the DataFrame are backed by pyarrow arrays. Needs pyarrow.
+    max_workers (int): 1 by default. Maximum number of acquirers fetched at the same time.
+
+    Returns:
+    if df=True (default):
+    acquirers (dataframe): a dataframe with information about the companies that took over the given company. If df=False, returns a list of dictionaries.
+
+    if df=False:
+    acquirers (list): a list of dictionaries with information about the companies that took over the given company.
+
+    '''
+
+    with _metrics.span('check_acquirers'):
+        return _run(_acquirers_core(ehraid, df, arrow), max_workers)
+
+## ASYNC VERSIONS
+
+class _AsyncZefixClient:
+
+    '''
+
+    asyncio counterpart of _ZefixClient, built on aiohttp. It uses the settings, the rate limiter and the cache of a _ZefixClient,
+    so the sync and async functions share the same limits and cached responses, and keeps its own pool of keep-alive connections.
+    It is bound to the event loop in which it is created.
+
+    Parameters:
+    settings (_ZefixClient): client whose settings, rate limiter and cache are used
+
+    '''
+
+    def __init__(self, settings):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError("The async functions need the aiohttp package: pip install aiohttp") from e
+        self._aiohttp = aiohttp
+        self.settings = settings
+        connector = aiohttp.TCPConnector(limit=settings.pool_size)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=settings.timeout))
+
+    async def _send(self, method, url, **kwargs):
+        # same retry policy as _ZefixClient._send. returns (status code, headers, body), raises ZefixError otherwise
+        settings = self.settings
+        endpoint = _endpoint(url[len(settings.base_url):])
+        for attempt in range(settings.retries + 1):
+            await asyncio.sleep(settings._slot_delay())
+            start = time.perf_counter()
+            try:
+                async with self.session.request(method, url, **kwargs) as r:
+                    status_code, headers = r.status, r.headers
+                    body = await r.read() if status_code == 200 else None
+            except (self._aiohttp.ClientError, asyncio.TimeoutError) as e:
+                _metrics.record_request(endpoint, time.perf_counter() - start, None, 0)
+                if attempt < settings.retries:
+                    _metrics.record_retry(endpoint, None, attempt)
+                    await asyncio.sleep(settings._retry_delay(attempt))
+                    continue
+                raise ZefixError(None, url, f"Connection Error, the request was not successful: {e!r}") from e
+            _metrics.record_request(endpoint, time.perf_counter() - start, status_code, len(body or b''))
+
+            if status_code in (200, 304):
+                return status_code, headers, body
+            if status_code in _RETRY_STATUS_CODES and attempt < settings.retries:
+                _metrics.record_retry(endpoint, status_code, attempt)
+                await asyncio.sleep(settings._retry_delay(attempt, headers.get('Retry-After')))
+                continue
+            raise ZefixError(status_code, url)
+
+    async def request(self, method, path, payload=None):
+        # same as _ZefixClient.request, without blocking the event loop: the cache is a SQLite file, so it is read and written in a thread
+        settings = self.settings
+        url = f"{settings.base_url}/{path.lstrip('/')}"
+        key, cached = None, None
+        if settings.cache is not None:
+            key, cached = await asyncio.to_thread(settings._cache_lookup, method, path, payload)
+        if cached is not None and cached['fresh']:
+            settings._count_cache('hits')
+            return cached['data']
+
+        kwargs = {'headers': settings._conditional_headers(cached)}
+        if payload is not None:
+            kwargs['json'] = payload
+        try:
+            status_code, headers, body = await self._send(method, url, **kwargs)
+        except ZefixError as e:
+            return settings._cache_fallback(cached, e)
+        if settings.cache is None:
+            return json.loads(body)
+        return await asyncio.to_thread(settings._cache_response, key, cached, status_code, headers, lambda: json.loads(body))
+
+    async def get(self, path):
+        return await self.request('GET', path)
+
+    async def post(self, path, payload):
+        return await self.request('POST', path, payload)
+
+    async def close(self):
+        await self.session.close()
+
+
+# async clients, one per event loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+async def _close_at_shutdown(loop, client):
+    # async generator left waiting at its yield: the event loop closes it when it shuts down (asyncio.run calls loop.shutdown_asyncgens),
+    # which closes the connections of the client, so that callers who never call aclose_client do not leak an open aiohttp session
+    try:
+        yield
+    finally:
+        if _async_clients.get(loop) is client:
+            del _async_clients[loop]
+        await client.close()
+
+
+def _async_client():
+    # async client of the running event loop, created again if configure_client changed the settings
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.settings is not _client:
+        if client is not None:
+            loop.create_task(client.close())
+        client = _async_clients[loop] = _AsyncZefixClient(_client)
+        client._shutdown = _close_at_shutdown(loop, client)
+        loop.create_task(client._shutdown.__anext__())
+    return client
+
+
+async def aclose_client():
+
+    '''
+
+    Closes the connections of the async client of the running event loop. This is done automatically when an event loop run by asyncio.run
+    ends; call it yourself to close them earlier, or at shutdown of an event loop that is not run by asyncio.run.
+
+    '''
+
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+async def _asearch_firms(name, client):
+    # async version of _search_firms, the local store (a SQLite file) is read and written in a thread
+    if _store is not None:
+        firms = await asyncio.to_thread(_local_search, name)
+        if firms is not None:
+            return firms
+    data = await client.post('firm/search.json', _search_query(name))
+    firms = list(data['list'])
+    if _store is not None:
+        await asyncio.to_thread(_save_search, name, firms, _search_complete(data))
+    return firms
+
+
+async def _aget_firm(ehraid, client):
+    # async version of _get_firm, the local store (a SQLite file) is read and written in a thread
+    if _store is not None:
+        data = await asyncio.to_thread(_store.firm, ehraid)
+        if data is not None:
+            return data
+    data = await client.get(f"firm/{ehraid}")
+    if _store is not None:
+        await asyncio.to_thread(_store.add_firm, data)
+    return data
+
+
+async def _alegal_forms_dictionary(client):
+    # async version of _legal_forms_dictionary, sharing the same table
+    if _legal_forms_expired():
+        try:
+            _set_legal_forms(await client.get("legalForm"))
+        except ZefixError:
+            if _legal_forms['dictionary'] is None:
+                raise
+    return _legal_forms['dictionary']
+
+
+async def _afetch_all(ehraids, client, semaphore):
+    # async version of _fetch_all(_get_firm, ...), at most as many firms at the same time as the semaphore allows
+    unique_ehraids = list(dict.fromkeys(ehraids))
+
+    async def fetch(ehraid):
+        async with semaphore:
+            return await _aget_firm(ehraid, client)
+
+    answers = await asyncio.gather(*(fetch(ehraid) for ehraid in unique_ehraids), return_exceptions=True)
+    results = {}
+    errors = {}
+    for ehraid, answer in zip(unique_ehraids, answers):
+        if isinstance(answer, Exception):
+            errors[ehraid] = repr(answer)
+        else:
+            results[ehraid] = answer
+    return results, errors
+
+
+async def _asearch_pages(queries, client, semaphore):
+    # async version of the 'search_pages' request: all the queries at once, at most as many at the same time as the semaphore allows
+
+    async def search(query):
+        async with semaphore:
+            return await client.post('firm/search.json', query)
+
+    answers = await asyncio.gather(*(search(query) for query in queries), return_exceptions=True)
+    results = {}
+    errors = {}
+    for position, answer in enumerate(answers):
+        if isinstance(answer, Exception):
+            errors[position] = repr(answer)
+        else:
+            results[position] = answer
+    return results, errors
+
+
+async def _aanswer(request, client, semaphore):
+    # answers a request of a core generator with the async client (see ## CORE)
+    kind = request[0]
+    if kind == 'search':
+        with _metrics.span('search'):
+            return await _asearch_firms(request[1], client)
+    if kind == 'search_page':
+        with _metrics.span('search'):
+            return await client.post('firm/search.json', request[1])
+    if kind == 'search_pages':
+        with _metrics.span('search_pages', queries=len(request[1])):
+            return await _asearch_pages(request[1], client, semaphore)
+    if kind == 'firm':
+        with _metrics.span('firm'):
+            return await _aget_firm(request[1], client)
+    if kind == 'firms':
+        with _metrics.span('firms', firms=len(request[1])):
+            return await _afetch_all(request[1], client, semaphore)
+    if kind == 'legal_forms':
+        with _metrics.span('legal_forms'):
+            return await _alegal_forms_dictionary(client)
+    if kind == 'translate':
+        # the translation backends are blocking: run them in a thread
+        return await asyncio.to_thread(_translate_records, request[1], request[2])
+    if kind == 'local_search':
+        return await asyncio.to_thread(_local_search, request[1])
+    if kind == 'save_search':
+        return await asyncio.to_thread(_save_search, request[1], request[2], request[3])
+    raise ValueError(f"Unknown request {kind}")
+
+
+async def _arun(core, max_workers=8):
+
+    '''
+
+    Runs a core generator with the async client, fetching up to max_workers firms at the same time, and returns its result.
+
+    '''
+
+    client = _async_client()
+    semaphore = asyncio.Semaphore(max(1, max_workers or 1))
+    answer, error = None, None
+    while True:
+        try:
+            request = core.throw(error) if error is not None else core.send(answer)
+        except StopIteration as stop:
+            return stop.value
+        answer, error = None, None
+        try:
+            answer = await _aanswer(request, client, semaphore)
+        except ZefixError as e:
+            error = e
+
+
+async def asearch_companies_named(name, simple=False, save=False, df=True, max_workers=8, errors=None, arrow=False, exhaustive=False, report=None):
+
+    '''
+
+    Async version of search_companies_named: same parameters and same results, without blocking the event loop.
+    Up to max_workers firms (8 by default) are fetched at the same time. Needs aiohttp.
+
+    Example: companies = await asearch_companies_named('Coop', df=False)
+
+    '''
+
+    with _metrics.span('asearch_companies_named'):
+        return await _arun(_search_core(name, simple, save, df, errors, arrow, exhaustive, report), max_workers)
+
+
+async def aget_acquisitions_data(ehraid, hops=0, save=False, df=False, max_hops=None, max_nodes=None, max_workers=8, return_edges=False, errors=None, arrow=False):
+
+    '''
+
+    Async version of get_acquisitions_data: same parameters and same results, without blocking the event loop.
+    Up to max_workers firms (8 by default) of the same level are fetched at the same time. Needs aiohttp.
+
+    '''
+
+    with _metrics.span('aget_acquisitions_data'):
+        return await _arun(_acquisitions_core(ehraid, hops, save, df, max_hops, max_nodes, return_edges, errors, arrow), max_workers)
+
+
+async def acheck_acquirers(ehraid, df=True, arrow=False, max_workers=8):
+
+    '''
+
+    Async version of check_acquirers: same parameters and same results, without blocking the event loop.
+    Up to max_workers acquirers (8 by default) are fetched at the same time. Needs aiohttp.
+
+    '''
+
+    with _metrics.span('acheck_acquirers'):
+        return await _arun(_acquirers_core(ehraid, df, arrow), max_workers)
+
+## FUNCTION 5
+def iter_companies(name, max_workers=1, ordered=True, skip=None, errors=None, processes=None, exhaustive=False, report=None):
+
+    '''
+
+    Generator version of search_companies_named: takes in a company name or part of it (string) and yields the information about
+    each company named like that as soon as it is ready, instead of waiting for the whole search to finish.
+
+    Parameters:
+    name (str): name of the company (or part of it) to search for. Not caps sensitive.
+    max_workers (int): 1 by default. Maximum number of firms whose details are fetched at the same time.
+    ordered (bool): True by default. If True, the companies are yielded in the order of the search. If False, they are yielded as soon as they are fetched.
+    skip (set): None by default. ehraids of the companies not to fetch again, e.g. jsonl_ehraids('file.jsonl') to resume a run.
+    errors (list): None by default. If a list is given, every firm that could not be fetched is appended to it as a dictionary {'ehraid': ..., 'error': ...}
+    processes (int): None by default. If greater than 1, the firms are fetched and enriched by that many worker processes (each one with
+                     max_workers threads, its own connection and caches, and its share of the rate limit), to use several CPU cores.
+                     With ordered=False, the companies are then yielded in blocks, as soon as a worker has finished them.
+    exhaustive (bool): False by default. If True, the search is paged and split so that it gets past the result cap, see search_companies_named.
+    report (dict): None by default. Filled with the completeness of an exhaustive search, see search_companies_named.
+
+    Yields:
+    company (dict): information about a company found in the search, with the same fields as search_companies_named
+
+    Raises ZefixError if the search itself is not successful.
+
+    Example: write_jsonl(iter_companies('Coop', max_workers=8), 'coop.jsonl')
+
+    '''
+
+    if type(name) != str:
+        raise TypeError("Please provide a string of the name of the company (or part of it) as input. Example: 'UBS' returns information about all companies with 'UBS' in their name.")
+
+    skip = skip or set()
+    firms = _run(_exhaustive_search_core(name, report), max_workers) if exhaustive else _search_firms(name)
+    ehraids = [firm['ehraid'] for firm in firms if firm['ehraid'] not in skip]
+
+    yield from _iter_enriched(ehraids, max_workers, ordered, errors, processes)
+
+
+def _translated_windows(companies):
+    # translates the purposes of a stream of records a window at a time, up to as many records as the translation layer sends to the
+    # backend in one call, so that the streaming functions use the same batches as search_companies_named. companies is the output
+    # of _iter_details: None means that the next record is not fetched yet, and then the records waiting are translated and yielded
+    # right away instead of waiting for a full window. Outside of 'translate' mode nothing is translated, so nothing waits
+    if _translation.mode != 'translate':
+        yield from (company for company in companies if company is not None)
+        return
+    window = []
+    for company in companies:
+        if company is not None:
+            window.append(company)
+        if window and (company is None or len(window) >= _translation.batch_size):
+            yield from _translate_records(window, ['purpose'])
+            window = []
+    if window:
+        yield from _translate_records(window, ['purpose'])
+
+
+def _iter_enriched(ehraids, max_workers=1, ordered=True, errors=None, processes=None):
 
     '''
 
-    Takes in a company name or part of it (string) and returns a dataframe with information about all companies named like that.
+    Yields _company_details(ehraid), with the purpose translated, for every ehraid (each one only once), fetching up to max_workers
+    of them at the same time. The purposes are translated in windows of records, one call of the translation backend per window.
+    At most a few times max_workers firms are in flight at once, so that long lists of ehraids do not pile up in memory.
+    Firms that cannot be fetched are skipped, printed and appended to errors (if given) as {'ehraid': ..., 'error': ...}.
+    With processes > 1, the work is shared by that many worker processes, see _iter_enriched_processes.
+
+    '''
+
+    if processes is not None and processes > 1:
+        yield from _iter_enriched_processes(ehraids, processes, max_workers, ordered, errors)
+        return
+
+    yield from _translated_windows(_iter_details(ehraids, max_workers, ordered, errors))
+
+
+def _iter_details(ehraids, max_workers=1, ordered=True, errors=None):
+    # the fetching part of _iter_enriched: yields _company_details(ehraid) for every ehraid, without translating the purposes,
+    # and None each time the next record is not ready yet (before waiting for it), see _translated_windows
+    ehraids = list(dict.fromkeys(ehraids))
+
+    def failed(ehraid, e):
+        print(f"Failed to fetch details for EHRAID {ehraid}:", repr(e))
+        if errors is not None:
+            errors.append({'ehraid': ehraid, 'error': repr(e)})
+
+    if max_workers is None or max_workers <= 1:
+        for ehraid in ehraids:
+            yield None
+            try:
+                company = _company_details(ehraid)
+            except Exception as e:
+                failed(ehraid, e)
+                continue
+            yield company
+        return
+
+    window = max_workers * 4
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        remaining = iter(ehraids)
+        try:
+            while True:
+                # keep the pool busy without submitting the whole list at once
+                for ehraid in remaining:
+                    pending.append((ehraid, executor.submit(_company_details, ehraid)))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+
+                if ordered:
+                    if not pending[0][1].done():
+                        yield None
+                    ehraid, future = pending.popleft()
+                else:
+                    if not any(future.done() for ehraid, future in pending):
+                        yield None
+                    wait([future for ehraid, future in pending], return_when=FIRST_COMPLETED)
+                    position = next(n for n in range(len(pending)) if pending[n][1].done())
+                    ehraid, future = pending[position]
+                    del pending[position]
+
+                try:
+                    company = future.result()
+                except Exception as e:
+                    failed(ehraid, e)
+                    continue
+                yield company
+        finally:
+            # the consumer stopped early: do not fetch the remaining firms
+            for ehraid, future in pending:
+                future.cancel()
+
+
+# number of ehraids sent to a worker process at a time by the process mode of _iter_enriched
+_PROCESS_SHARD_SIZE = 200
+
+
+def _process_settings():
+    # settings of the client, translation layer and store of this process, so that each worker process builds its own.
+    # The workers share the cache files: their reads do not write (track_usage=False), so warm runs do not wait for the write lock
+    def cache_settings(cache):
+        return None if cache is None else {'path': cache.path, 'ttl': cache.ttl, 'max_entries': cache.max_entries, 'track_usage': False}
+
+    client = {'base_url': _client.base_url, 'retries': _client.retries, 'backoff': _client.backoff, 'max_backoff': _client.max_backoff,
+              'rate_limit': _client.rate_limit, 'timeout': _client.timeout, 'pool_size': _client.pool_size, 'cache': cache_settings(_client.cache)}
+    translation = {'backend': _translation.backend, 'mode': _translation.mode, 'cache_size': _translation.cache_size,
+                   'cache': cache_settings(_translation.cache), 'batch_size': _translation.batch_size}
+    store = None if _store is None else {'path': _store.path, 'ttl': _store.ttl}
+    return client, translation, store
+
+
+# client, translation layer and store a forked worker process inherited from the main process, kept alive so that their SQLite
+# connections (opened by the main process) are never closed or used by the worker
+_inherited_settings = []
+
+
+def _process_init(client, translation, store, processes):
+    # runs once in every worker process: its own HTTP session (with its share of the rate limit), caches, translation layer and store
+    global _client, _translation, _store
+    _inherited_settings.append((_client, _translation, _store))
+    if client['rate_limit']:
+        client = dict(client, rate_limit=client['rate_limit'] / processes)
+    _client = _ZefixClient(**dict(client, cache=ZefixCache(**client['cache']) if client['cache'] else None))
+    _translation = _TranslationLayer(**dict(translation, cache=ZefixCache(**translation['cache']) if translation['cache'] else None))
+    _store = CompanyStore(**store) if store else None
+
+
+def _process_enrich(ehraids, max_workers):
+    # unit of work of a worker process: enriches a shard of ehraids with max_workers threads. The records go back to the main
+    # process as one list of plain dictionaries per shard (a single pickle, about half the size of the same records as JSON text
+    # and twice as fast to load), never as DataFrames, so the main process only has to unpickle and yield them
+    errors = []
+    records = list(_iter_enriched(ehraids, max_workers, ordered=True, errors=errors))
+    return records, errors
+
+
+def _iter_enriched_processes(ehraids, processes, max_workers=1, ordered=True, errors=None):
+
+    '''
+
+    Process mode of _iter_enriched: the ehraids are split in shards of _PROCESS_SHARD_SIZE, enriched by a pool of processes worker
+    processes (each one fetching up to max_workers firms at the same time, with its own HTTP session and caches), and the records are
+    yielded shard by shard, in order if ordered is True. At most two shards per process are in flight at once.
+
+    '''
+
+    ehraids = list(dict.fromkeys(ehraids))
+    shards = [ehraids[start:start + _PROCESS_SHARD_SIZE] for start in range(0, len(ehraids), _PROCESS_SHARD_SIZE)]
+
+    window = processes * 2
+    with ProcessPoolExecutor(max_workers=processes, initializer=_process_init, initargs=_process_settings() + (processes,)) as executor:
+        pending = deque()
+        remaining = iter(shards)
+        try:
+            while True:
+                for shard in remaining:
+                    pending.append(executor.submit(_process_enrich, shard, max_workers))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+
+                if ordered:
+                    future = pending.popleft()
+                else:
+                    wait(pending, return_when=FIRST_COMPLETED)
+                    future = next(future for future in pending if future.done())
+                    pending.remove(future)
+
+                records, shard_errors = future.result()
+                if errors is not None:
+                    errors.extend(shard_errors)
+                yield from records
+        finally:
+            # the consumer stopped early: do not enrich the remaining shards
+            for future in pending:
+                future.cancel()
+
+
+def _open_jsonl(path, mode):
+    # JSON Lines file, gzip compressed if the name ends with .gz
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def read_jsonl(path):
+
+    '''
+
+    Reads the records saved in a JSON Lines file (.jsonl, or .jsonl.gz for gzip). A last record cut off by an interrupted run is ignored.
 
     Parameters:
-    name (str): name of the company (or part of it) to search for. Not caps sensitive.
-    simple (bool): False by default. If True, returns a simplified version of the dictionary with only the name, ehraid, and legalSeat of the company.
-    save (bool): False by default. If True, saves the data to a JSON file called "name_companies.json". If simple is also True at the same time, saves the data to a JSON file called "name_companies_simple.json" instead.
-    df (bool): True by default. If True, returns the data as a pandas DataFrame. If False, returns the data as a list of dictionaries.
+    path (str): path of the file
 
     Returns:
-    
-    if df=False: 
-    list_of_companies (list): a list of dictionaries, each containing information about a company found in the search
+    records (list): list of dictionaries, one per line of the file
 
-    if df=True (default): 
-    list_of_companies (DataFrame): a pandas DataFrame containing information about all companies found in the search
-
-    The dataframe in the list will contain the following information about the company:
+    '''
 
-    'name':                 <-- name of the company,
-    'ehraid':               <-- unique identifier of the company,
-    'legalSeat':            <-- location of the company's legal seat,
-    'status':               <-- status of the company (active or not),
-    'deleteDate':           <-- date when the company was deleted (if applicable),
-    'wasTakenOverBy':       <-- name of the company that took over this one (if applicable),
-    'purpose':              <-- purpose of the company,
-    'legalForm':            <-- legal form of the company,
-    'cancelled':            <-- boolean value indicating if the company is cancelled or not,
-    'n_of_shabPub':         <-- number of publications in the Swiss Official Gazette of Commerce,
-    'n_of_branchOffices':   <-- number of branch offices of the company,
-    'n_of_oldNames':        <-- number of old names of the company,
-    'n_of_hasTakenOver':    <-- number of companies taken over by this one,
-    'town':                 <-- town where the company is located,
-    'swissZipCode':         <-- Swiss zip code of the company,
+    records = []
+    if not os.path.exists(path):
+        return records
+    try:
+        with _open_jsonl(path, 'r') as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # incomplete line written by an interrupted run
+                    continue
+    except (EOFError, OSError, zlib.error):
+        # gzip file cut off by an interrupted run: keep what could be read
+        pass
+    return records
+
+
+def jsonl_ehraids(path):
 
-    if simple=True, the dataframe/list of dictionaries will only contain the following:
+    '''
 
-    'name':                 <-- name of the company,
-    'ehraid':               <-- unique identifier of the company,
-    'legalSeat':            <-- location of the company's legal seat,
+    Returns the set of ehraids already saved in a JSON Lines file, to resume a partially completed run with iter_companies(..., skip=...).
 
     '''
-    # check if input is a string
-    if type(name) != str:
-        return "Please provide a string of the name of the company (or part of it) as input. Example: 'UBS' returns information about all companies with 'UBS' in their name."
-    
-    # access the information
-    search_url = 'https://www.zefix.ch/ZefixREST/api/v1/firm/search.json'
-    search_query = {
-        "name" : name,
-        "searchType" : "exact"
-    }
-    headers = {'Content-Type': 'application/json'}
-    json_data = json.dumps(search_query)
-    r = requests.post(search_url, headers=headers, data=json_data)
-
-    # check if the request was successful, return error message if not
-    if r.status_code == 400:
-        return "400 Bad Request Error"
-    elif r.status_code == 401:
-        return "401 Unauthorized Error"
-    elif r.status_code == 403:
-        return "403 Forbidden Error"
-    elif r.status_code == 404:
-        return "404 Not Found Error"
-    elif r.status_code == 408:
-        return "408 Request Timeout Error"
-    elif r.status_code == 500:
-        return "500 Internal Server Error"
-    elif r.status_code == 502:
-        return "502 Bad Gateway Error"
-    elif r.status_code == 504:
-        return "504 Gateway Timeout Error"
-    elif r.status_code != 200:
-        return "Unexpected Error, the request was not successful"
-
-    # convert response to json
-    data = r.json()
-
-    # create an empty list to store the information of the companies found in the search
-    firm_data = []
-
-    # populate the firm_data list with the information of the companies found in the search
-    for i in range(len(data['list'])):
-        firm_data.append(data['list'][i])
 
-    # create an empty list to store the results for each of the companies found in the search
-    list_of_companies = []
+    return {record['ehraid'] for record in read_jsonl(path) if 'ehraid' in record}
 
-    # if option simple is true, return the simplified version of the dictionary
-    if simple==True:
-        for n in range(len(firm_data)):
-            company = {}
 
-            company['name'] = firm_data[n]['name']
+def write_jsonl(records, path, append=True):
 
-            company['ehraid'] = firm_data[n]['ehraid']
+    '''
 
-            company['legalSeat'] = firm_data[n]['legalSeat']
+    Writes records to a JSON Lines file (one JSON object per line) as they arrive, flushing after each one, so that nothing
+    already fetched is lost if the run stops. The file is gzip compressed if its name ends with .gz.
 
-            company['cantonalExcerptWeb'] = firm_data[n]['cantonalExcerptWeb']
+    Parameters:
+    records (iterable): dictionaries to save, e.g. the output of iter_companies
+    path (str): path of the file
+    append (bool): True by default. If True, the records are added to the file. If False, the file is overwritten.
 
-            list_of_companies.append(company)
+    Returns:
+    n (int): number of records written
 
-        # Save data to JSON file if option save is True
-        if simple == True and save == True:
-            with open(f'{name}_companies_simple.json', 'w') as file:
-                json.dump(list_of_companies, file, indent=4)
-            print(f"Data saved to {name}_companies_simple.json")
-        
-        # dataframe option
-        if df==True:
-            list_of_companies = pd.DataFrame(list_of_companies)
-        
-        return list_of_companies
-    
-    for n in range(len(firm_data)):
+    Example (resume an interrupted run):
+    write_jsonl(iter_companies('AG', skip=jsonl_ehraids('ag.jsonl')), 'ag.jsonl')
 
-        # select ehraid
-        ehraid = firm_data[n]['ehraid']
+    '''
 
-        # get information about the firm using its ehraid
-        company_url = f"https://www.zefix.ch/ZefixREST/api/v1/firm/{ehraid}"
-        r = requests.get(company_url)
-        d = r.json()
+    if append and os.path.exists(path):
+        _repair_jsonl(path)
+
+    n = 0
+    with _open_jsonl(path, 'a' if append else 'w') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+            file.flush()
+            n += 1
+    print(f"{n} records saved to {path}")
+    return n
+
+def _repair_jsonl(path):
+    # repairs the end of a JSON Lines file left by an interrupted run before adding to it, reading the file once:
+    # if a line is cut off (or a gzip file is truncated), the file is written again with the complete records only
+    lines = []
+    clean = True
+    try:
+        with _open_jsonl(path, 'r') as file:
+            for line in file:
+                lines.append(line)
+    except (EOFError, OSError, zlib.error):
+        clean = False
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            clean = False
+    if clean and all(line.endswith('\n') for line in lines):
+        return
+    with _open_jsonl(path, 'w') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+## FUNCTION 6
+def read_ehraids(path, column='ehraid'):
 
-        url = "https://www.zefix.ch/ZefixREST/api/v1/legalForm"
-        response = requests.get(url)
-        legal_forms = response.json()
+    '''
 
-        # create a dictionary with legal form id as key
-        legal_forms_dictionary = {item['id']: item for item in legal_forms}
+    Reads a list of ehraids from a CSV, Parquet or JSON Lines file.
 
-        # create empty dictionary to store the searched company information
-        company={}
-        
-        # attributes to keep
-        attributes = ['name', 'ehraid', 'legalSeat', 'cantonalExcerptWeb', 'status', 'deleteDate', 'wasTakenOverBy', 'purpose']
+    Parameters:
+    path (str): path of the file. The format is taken from the extension: .csv, .parquet, .jsonl or .jsonl.gz
+    column (str): 'ehraid' by default. Name of the column (or JSON field) containing the ehraids
 
-        # get request from zefix to get the desired company information
-        company_url = f"https://www.zefix.ch/ZefixREST/api/v1/firm/{ehraid}"
-        r = requests.get(company_url)
-        data = r.json()
-    
-        for attrib in attributes:
-            company[attrib] = data[attrib]
-        
-        #translate the information in 'purpuse' to english
-        if company["purpose"]:
-            translator = Translator()
-            purpose_english = translator.translate(company['purpose'], dest='en')
-            company['purpose'] = purpose_english.text
-
-        #translate the information in 'status' to english
-        if company["status"]:
-            if company['status'].upper() == 'EXISTIEREND':
-                company['status'] = 'Active'
-            elif company['status'].upper() == 'GELOESCHT':
-                company['status'] = 'Deleted'
-            elif company['status'].upper() == 'IN_AUFLOESUNG':
-                company['status'] = 'In Liquidation'
-            else:
-                translator = Translator()
-                status_english = translator.translate(company['status'], dest='en')
-                company['status'] = status_english.text
+    Returns:
+    ehraids (list): the ehraids, as integers, in the order of the file and without duplicates
 
-        # get the English name of a legal form associated with the given ID provided by the API
-        firm_legal_form_name = legal_forms_dictionary[data['legalFormId']]['name']['en']
+    '''
 
-        # fill the legalForm field in the dictionary with the english name we just found
-        company['legalForm'] = firm_legal_form_name 
-        
-        # cancelled field      
-        if data['deleteDate'] is not None:
-            company['cancelled'] = True
-        else:
-            company['cancelled'] = False
-        
-        # defining all the 'n_...' attributes by counting 
-        len_fields = [ 'shabPub', 'branchOffices', 'oldNames', 'hasTakenOver']
-        for field in len_fields:
-            if data[field] is not None:
-                company[f"n_of_{field}"] = len(data[field])
-            else:
-                company[f"n_of_{field}"] = 0
-        
-        # town/swissZipCode fields
-        company['town'] = data['address']['town']
-        company['swissZipCode'] = data['address']['swissZipCode']
+    import pandas as pd
 
-        list_of_companies.append(company)
+    path = str(path)
+    if path.endswith('.parquet'):
+        values = pd.read_parquet(path, columns=[column])[column]
+    elif path.endswith('.jsonl') or path.endswith('.jsonl.gz'):
+        values = [record.get(column) for record in read_jsonl(path)]
+    else:
+        values = pd.read_csv(path, usecols=[column])[column]
+    return list(dict.fromkeys(int(value) for value in values if pd.notna(value)))
 
-    # Save data to JSON file if option save is True
-    if save == True:
-        with open(f'{name}_companies.json', 'w') as file:
-            json.dump(list_of_companies, file, indent=4)
-        print(f"Data saved to {name}_companies.json")        
 
-    # dataframe option
-    if df==True:
-        list_of_companies = pd.DataFrame(list_of_companies)
+# fields of the enriched records that are lists or dictionaries, saved as JSON text in columnar files
+_NESTED_FIELDS = ['wasTakenOverBy']
 
-    return list_of_companies
 
-## FUNCTION 2
-def get_acquisitions_data(ehraid, hops=0, save=False, df=False):
+def _write_part(records, directory, number, file_format):
+    # writes one chunk of records as a new part file. The file is written under a temporary name and then renamed,
+    # so that a part file is either complete or missing, and the ehraids in the directory are exactly the ones done
+    table = _to_frame(records)
+    for field in _NESTED_FIELDS:
+        if field in table.columns:
+            table[field] = [json.dumps(value) for value in table[field]]
+    path = os.path.join(directory, f"part-{number:05d}.{file_format}")
+    temporary_path = path + '.tmp'
+    if file_format == 'parquet':
+        table.to_parquet(temporary_path, index=False)
+    else:
+        table.to_csv(temporary_path, index=False)
+    os.replace(temporary_path, path)
+    return path
+
+
+def _part_files(directory, file_format):
+    # part files already written in the output directory, in order
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, file) for file in os.listdir(directory)
+                  if file.startswith('part-') and file.endswith('.' + file_format))
+
 
+def enrich_file(input_path, output_dir, column='ehraid', max_workers=8, chunk_size=1000, file_format='csv', errors=None, processes=None):
 
     '''
 
-    Takes in an ehraid (string) and returns a list of dictionaries with information about the firm and all the firms it has taken over. 
-    This function finds both direct and indirect acquisitions. For example, if firm A has taken over firm B, and firm B has taken over firm C, 
-    the function will return information about firm A, firm B, and firm C. Starting from A, the function will count the number of "hops" to reach
-    the last firm in the chain. The function has an option to save the data to a JSON file.
-    
+    Takes in a file of ehraids (CSV, Parquet or JSON Lines) and saves, for each of them, the same information that search_companies_named returns:
+    translated status and purpose, english legalForm, cancelled, the n_of_* counts, town and swissZipCode.
+
+    The firms are fetched concurrently (max_workers at a time, within the rate limit of the client) and saved in chunks of chunk_size firms,
+    each chunk as a new part file (part-00000.csv, part-00001.csv, ...) in output_dir. The part files work as a checkpoint:
+    if the run stops, running the function again with the same output_dir only fetches the ehraids that are not saved yet.
+
     Parameters:
-    ehraid (str): ehraid of the firm to start from
-    hops (int): DO NOT CHANGE THIS VALUE, it is used as a counter for the number of hops from the initial ehraid
-    save (bool): if True, saves the data to a JSON file called 'takeovers.json'
-    df (bool): if True, returns the data as a pandas DataFrame
+    input_path (str): path of the file with the ehraids (.csv, .parquet, .jsonl or .jsonl.gz)
+    output_dir (str): directory where the part files are saved, created if it does not exist
+    column (str): 'ehraid' by default. Name of the column of input_path containing the ehraids
+    max_workers (int): 8 by default. Maximum number of firms fetched at the same time
+    chunk_size (int): 1000 by default. Number of firms saved in each part file
+    file_format (str): 'csv' (default) or 'parquet' (smaller and faster to load, needs pyarrow)
+    errors (list): None by default. If a list is given, every firm that could not be fetched is appended to it as a dictionary {'ehraid': ..., 'error': ...}
+    processes (int): None by default. If greater than 1, the firms are enriched by that many worker processes, each one with max_workers threads,
+                     its own connection and caches, and its share of the rate limit
 
     Returns:
+    n (int): number of firms saved by this run
 
-    if df=False (default):
-    acquisitions (list): a list of dictionaries, each containing information about a firm and the firms it has taken over
+    The field wasTakenOverBy is saved as JSON text. You can load all the parts at once with load_enriched(output_dir).
 
-    if df=True:
-    acquisitions (DataFrame): a pandas DataFrame containing information about all firms and the firms they have taken over
-    
     '''
-    
 
-    acquisitions = []
+    import pandas as pd
 
-    # check if ehraid is a dictionary: if it is, get it as a string
-    ehraid = ehraid.get('ehraid') if isinstance(ehraid, dict) else ehraid
+    if file_format not in ('parquet', 'csv'):
+        raise ValueError("file_format must be 'parquet' or 'csv'")
+    os.makedirs(output_dir, exist_ok=True)
 
-    # get the data of the firm with the given ehraid from the API 
-    url = f"https://www.zefix.ch/ZefixREST/api/v1/firm/{ehraid}"
-    r = requests.get(url)
-    data = r.json()
-
-    # check if the request was successful, return error message if not
-    if r.status_code == 400:
-        return "400 Bad Request Error"
-    elif r.status_code == 401:
-        return "401 Unauthorized Error"
-    elif r.status_code == 403:
-        return "403 Forbidden Error"
-    elif r.status_code == 404:
-        return "404 Not Found Error"
-    elif r.status_code == 408:
-        return "408 Request Timeout Error"
-    elif r.status_code == 500:
-        return "500 Internal Server Error"
-    elif r.status_code == 502:
-        return "502 Bad Gateway Error"
-    elif r.status_code == 504:
-        return "504 Gateway Timeout Error"
-    elif r.status_code != 200:
-        return "Unexpected Error, the request was not successful"
-    
-    # Extract data of firm as a dictionary, with the number of hops from the initial ehraid
-    firm = {
-        "name": data.get("name"),
-        "ehraid": data.get("ehraid"),
-        "legalSeat": data.get("legalSeat"),
-        "legalFormId": data.get("legalFormId"),
-        "status": data.get("status"),
-        "cantonalExcerptWeb": data.get("cantonalExcerptWeb"),
-        "deleteDate": data.get("deleteDate"),
-        "hops": hops
+    # resume: skip the ehraids already saved in the output directory
+    parts = _part_files(output_dir, file_format)
+    done = set()
+    for part in parts:
+        saved = pd.read_parquet(part, columns=['ehraid']) if file_format == 'parquet' else pd.read_csv(part, usecols=['ehraid'])
+        done.update(int(ehraid) for ehraid in saved['ehraid'])
+
+    ehraids = [ehraid for ehraid in read_ehraids(input_path, column) if ehraid not in done]
+    if done:
+        print(f"Resuming: {len(done)} firms already saved in {output_dir}, {len(ehraids)} left")
+
+    number = len(parts)
+    chunk = []
+    n = 0
+    for company in _iter_enriched(ehraids, max_workers, ordered=False, errors=errors, processes=processes):
+        chunk.append(company)
+        if len(chunk) >= chunk_size:
+            _write_part(chunk, output_dir, number, file_format)
+            number += 1
+            n += len(chunk)
+            chunk = []
+    if chunk:
+        _write_part(chunk, output_dir, number, file_format)
+        n += len(chunk)
+
+    print(f"{n} firms saved to {output_dir}")
+    return n
+
+
+def load_enriched(output_dir, file_format='csv'):
+
+    '''
+
+    Loads all the part files saved by enrich_file in output_dir as one pandas DataFrame.
+
+    '''
+
+    import pandas as pd
+
+    parts = _part_files(output_dir, file_format)
+    if not parts:
+        return pd.DataFrame()
+    if file_format == 'parquet':
+        return pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+    return pd.concat([pd.read_csv(part) for part in parts], ignore_index=True)
+
+
+## FUNCTION 7
+
+# fields of the firm details that the enriched records are derived from: a firm is derived and translated again only if one of them changed
+_REFRESH_FIELDS = ['name', 'legalSeat', 'legalFormId', 'status', 'deleteDate', 'cantonalExcerptWeb', 'purpose', 'address',
+                   'shabPub', 'branchOffices', 'oldNames', 'hasTakenOver', 'wasTakenOverBy']
+
+
+def _refresh_snapshot(data):
+    # the part of the details of a firm compared between two refreshes: the changelog is computed from it
+    return {
+        'name': data.get('name'),
+        'status': data.get('status'),
+        'deleteDate': data.get('deleteDate'),
+        'shabPub': sorted(str(publication.get('shabId')) for publication in data.get('shabPub') or []),
+        'hasTakenOver': sorted(int(element['ehraid']) for element in data.get('hasTakenOver') or []),
+        'wasTakenOverBy': sorted(int(element['ehraid']) for element in data.get('wasTakenOverBy') or []),
     }
-    
-    # translate the information in 'status' to english
-    if firm["status"]:
-        if firm['status'].upper() == 'EXISTIEREND':
-            firm['status'] = 'Active'
-        elif firm['status'].upper() == 'GELOESCHT':
-            firm['status'] = 'Deleted'
-        elif firm['status'].upper() == 'IN_AUFLOESUNG':
-            firm['status'] = 'In Liquidation'
-        else:
-            translator = Translator()
-            status_english = translator.translate(firm['status'], dest='en')
-            firm['status'] = status_english.text
-        
-    acquisitions.append(firm)
 
-    # if hastakenover is not empty, for each element in hastakenover run again this function with the element as input 
-    # (since it's the ehrid of the firms taken over) and increase hops by 1
-    
-    if data["hasTakenOver"] is not None:
-        for element in data["hasTakenOver"]:
-            acquisitions.extend(get_acquisitions_data(element, hops + 1))
 
-        
-    # Save data to JSON file if user 
-    if save == True:
-        with open('takeovers.json', 'w') as file:
-            json.dump(acquisitions, file, indent=4)
-        print("Data saved to takeovers.json")
+def _refresh_fingerprint(data):
+    # hash of the fields the enriched record is derived from
+    fields = {field: data.get(field) for field in _REFRESH_FIELDS}
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode('utf-8')).hexdigest()
 
-    if df==True:
-        acquisitions = pd.DataFrame(acquisitions)
 
-    return acquisitions
+# added to the fingerprint saved for a firm whose record is not fully translated, so that the next run never matches it
+# and derives and translates the record again (the changes are still computed from the snapshots, so none is reported twice)
+_UNTRANSLATED = ' untranslated'
 
-## FUNCTION 3
 
-def plot_acquisitions(acquisitions):
-    
+def _refresh_translated(status, purpose):
+    # True if a record with this original status and purpose was fully translated to english: in 'translate' mode, and with
+    # a translation known for both (a batch that failed leaves its texts in their original language)
+    if _translation.mode != 'translate':
+        return False
+    status_known = not status or status in _STATUS_ENGLISH.values() or status.upper() in _STATUS_ENGLISH or _translation.known(status)
+    return status_known and _translation.known(purpose)
+
+
+def _refresh_changes(ehraid, old, new):
+
     '''
 
-    Takes in a list of dictionaries with information about firms and their acquisitions (output of the function acquisitions_data) and plots the acquisitions on a graph.
-    From left to right, the x axis represents the number of acquisition "hops" from the initial firm. 
-    
+    Compares two snapshots of a firm (see _refresh_snapshot) and returns the list of changes, as dictionaries
+    {'ehraid', 'name', 'change', 'old', 'new'}. change is one of 'new', 'name', 'status', 'deleted', 'publications',
+    'takeover' (the firm has taken over another one) or 'taken_over' (the firm was taken over).
+
+    '''
+
+    def change(kind, old_value, new_value):
+        return {'ehraid': ehraid, 'name': new['name'], 'change': kind, 'old': old_value, 'new': new_value}
+
+    if old is None:
+        return [change('new', None, new['status'])]
+
+    changes = []
+    if new['name'] != old['name']:
+        changes.append(change('name', old['name'], new['name']))
+    if new['status'] != old['status']:
+        changes.append(change('status', old['status'], new['status']))
+    if new['deleteDate'] is not None and old['deleteDate'] is None:
+        changes.append(change('deleted', None, new['deleteDate']))
+    publications = sorted(set(new['shabPub']) - set(old['shabPub']))
+    if publications:
+        changes.append(change('publications', len(old['shabPub']), publications))
+    changes.extend(change('takeover', None, acquired) for acquired in sorted(set(new['hasTakenOver']) - set(old['hasTakenOver'])))
+    changes.extend(change('taken_over', None, acquirer) for acquirer in sorted(set(new['wasTakenOverBy']) - set(old['wasTakenOverBy'])))
+    return changes
+
+
+class RefreshState:
+
+    '''
+
+    State of refresh_companies between runs (SQLite file): for each firm, the hash of the fields its record is derived from,
+    a snapshot of its name, status, publications and takeovers, and its last enriched record; plus the changelog of all the runs.
+
     Parameters:
-    acquisitions (list of dictionaries): list of dictionaries with information about firms and their acquisitions. You can get data structured this way running the function acquisitions_data from the same package as this one.
-    
+    path (str): path of the SQLite file, created if it does not exist
+
     '''
 
+    def __init__(self, path='zefix_refresh.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS firms (
+                ehraid INTEGER PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                snapshot TEXT NOT NULL,
+                record BLOB NOT NULL,
+                checked_at REAL NOT NULL,
+                changed_at REAL NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS changes (
+                ehraid INTEGER NOT NULL,
+                name TEXT,
+                change TEXT NOT NULL,
+                old TEXT,
+                new TEXT,
+                detected_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS changes_detected_at ON changes (detected_at);
+        ''')
+        self._db.commit()
+
+    def get(self, ehraids):
+
+        '''
+
+        Returns a dictionary ehraid -> (fingerprint, snapshot, record) of the firms of ehraids already refreshed once.
+
+        '''
+
+        found = {}
+        ehraids = [int(ehraid) for ehraid in ehraids]
+        with self._lock:
+            # in slices, below the maximum number of parameters of a SQLite query
+            for start in range(0, len(ehraids), 500):
+                part = ehraids[start:start + 500]
+                rows = self._db.execute(f"SELECT ehraid, fingerprint, snapshot, record FROM firms WHERE ehraid IN ({','.join('?' * len(part))})", part)
+                for ehraid, fingerprint, snapshot, record in rows:
+                    found[ehraid] = (fingerprint, json.loads(snapshot), json.loads(zlib.decompress(record)))
+        return found
+
+    def save(self, checked, changed, changes):
+
+        '''
+
+        Saves the result of refreshing a chunk of firms in one transaction.
+
+        Parameters:
+        checked (list): ehraids of the firms found unchanged
+        changed (list): (ehraid, fingerprint, snapshot, record) of the firms that are new or changed
+        changes (list): changes found, see _refresh_changes
+
+        '''
+
+        now = time.time()
+        with self._lock:
+            self._db.executemany('UPDATE firms SET checked_at = ? WHERE ehraid = ?', [(now, int(ehraid)) for ehraid in checked])
+            self._db.executemany(
+                'INSERT OR REPLACE INTO firms (ehraid, fingerprint, snapshot, record, checked_at, changed_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(int(ehraid), fingerprint, json.dumps(snapshot), zlib.compress(json.dumps(record).encode('utf-8')), now, now)
+                 for ehraid, fingerprint, snapshot, record in changed])
+            self._db.executemany(
+                'INSERT INTO changes (ehraid, name, change, old, new, detected_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(int(c['ehraid']), c['name'], c['change'], json.dumps(c['old']), json.dumps(c['new']), now) for c in changes])
+            self._db.commit()
+
+    def changes(self, since=None):
+
+        '''
+
+        Returns the changes found by all the runs (or by the runs after the unix time since), oldest first,
+        as dictionaries {'ehraid', 'name', 'change', 'old', 'new', 'detected_at'}.
+
+        '''
+
+        with self._lock:
+            rows = self._db.execute('SELECT ehraid, name, change, old, new, detected_at FROM changes WHERE detected_at >= ? ORDER BY rowid',
+                                    (since or 0,)).fetchall()
+        return [{'ehraid': ehraid, 'name': name, 'change': change, 'old': json.loads(old), 'new': json.loads(new), 'detected_at': detected_at}
+                for ehraid, name, change, old, new, detected_at in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM firms').fetchone()[0]
+
+
+def refresh_companies(ehraids, state='zefix_refresh.sqlite', max_workers=8, chunk_size=1000, changelog_path=None, errors=None):
 
-    if type(acquisitions) != list:
-        return "Please provide a list of dictionaries with information about firms and their acquisitions as input. You can get this data by running the function acquisitions_data in this same package. Use the default option df=False"
-    
-    if type(acquisitions[0]) != dict:
-        return "Please provide a list of dictionaries with information about firms and their acquisitions as input. You can get this data by running the function acquisitions_data in this same package. Use the default option df=False"
+    '''
 
-    if 'hops' in acquisitions[0] and type(acquisitions[0]['hops']) == int:
-        # create a dataframe with the acquisitions data
-        df = pd.DataFrame(acquisitions)
+    Incremental version of the enrichment of enrich_file, for a portfolio of firms refreshed regularly (e.g. every day).
+    The details of every firm are fetched, but a firm is derived and translated again only if its publications (shabPub)
+    or one of the fields its record is derived from changed since the last run; the other firms keep the record saved in state.
+    Every run also finds what changed: new firms, changes of name or status, deletions, new publications and new takeovers.
 
-        # add a colunm named y. For each different value of hops, assign to each record a value of y that goes from 0 upwards
-        df['y'] = df.groupby('hops').cumcount()
+    The firms are processed in chunks of chunk_size, and state is saved after each chunk, so an interrupted run loses at most one chunk.
+    A firm whose record could not be fully translated (the translation backend failed, or the mode is 'none' or 'deferred')
+    is derived and translated again at the next run, even if it did not change.
+    The details are always asked to the API: the local store and fresh entries of the response cache are not used (a cached response
+    is only reused when the API answers that it did not change), so that no change is missed.
 
-        # add 0.2 to y to space the points from the x axis
-        df['y'] = df['y'] + 0.2
+    Parameters:
+    ehraids (list): ehraids of the firms to refresh, e.g. read_ehraids('portfolio.csv')
+    state (RefreshState or str): 'zefix_refresh.sqlite' by default. A RefreshState, or the path of its SQLite file
+    max_workers (int): 8 by default. Maximum number of firms fetched at the same time
+    chunk_size (int): 1000 by default. Number of firms fetched and saved together
+    changelog_path (str): None by default. If given, the changes found are added to this JSON Lines file
+    errors (list): None by default. If a list is given, every firm that could not be fetched or whose details could not be read
+                   is appended to it as a dictionary {'ehraid': ..., 'error': ...}. These firms are left as they were in state.
 
-        # create a plot
-        plt.figure(figsize=(15, 10))
+    Returns:
+    records (list): the enriched record of every firm (same fields as search_companies_named). Firms that could not be fetched or read keep their last saved record.
+    changes (list): the changes found, as dictionaries {'ehraid', 'name', 'change', 'old', 'new'}, where change is one of
+                    'new', 'name', 'status', 'deleted', 'publications', 'takeover' (new is the ehraid of the firm taken over)
+                    or 'taken_over' (new is the ehraid of the acquirer)
 
-        # each point is a firm, with its name as label
-        for i in range(len(df)):
-            plt.text(df['hops'][i], df['y'][i], df['name'][i], ha='center', wrap=True)
+    Example: records, changes = refresh_companies(read_ehraids('portfolio.csv'), changelog_path='changes.jsonl')
 
-        #the size of the plot depends on the number of hops (for width) and the number of y (for height)
-        plt.xlim(0, df['hops'].max()+1)
-        plt.ylim(0, df['y'].max()+1)
+    '''
 
-        #plot the points
-        plt.scatter(df['hops'], df['y'], alpha=0)
+    state = RefreshState(state) if isinstance(state, str) else state
+    ehraids = list(dict.fromkeys(int(ehraid) for ehraid in ehraids))
+
+    records = []
+    all_changes = []
+    n_changed = 0
+
+    # the changelog is repaired and opened once for the whole run, the changes of each chunk are added to it as they are found
+    changelog = None
+    if changelog_path is not None:
+        if os.path.exists(changelog_path):
+            _repair_jsonl(changelog_path)
+        changelog = _open_jsonl(changelog_path, 'a')
+
+    try:
+        for start in range(0, len(ehraids), chunk_size):
+            chunk = ehraids[start:start + chunk_size]
+            saved = state.get(chunk)
+            results, errors_by_ehraid = _fetch_all(_get_current_firm, chunk, max_workers)
+
+            checked = []
+            changed = []
+            changes = []
+            new_records = []
+            for ehraid in chunk:
+                if ehraid not in errors_by_ehraid:
+                    data = results[ehraid]
+                    fingerprint = _refresh_fingerprint(data)
+                    old_fingerprint, old_snapshot, old_record = saved.get(ehraid, (None, None, None))
+                    if fingerprint == old_fingerprint:
+                        checked.append(ehraid)
+                        records.append(old_record)
+                        continue
+
+                    # new or changed firm: derive its record again. Details that cannot be read (e.g. an unknown legal form)
+                    # are reported like a failed request instead of stopping the whole run
+                    try:
+                        snapshot = _refresh_snapshot(data)
+                        record = _company_record(data, _legal_forms_dictionary())
+                    except Exception as e:
+                        errors_by_ehraid[ehraid] = repr(e)
+                    else:
+                        changed.append((ehraid, fingerprint, snapshot, record))
+                        changes.extend(_refresh_changes(ehraid, old_snapshot, snapshot))
+                        new_records.append(record)
+                        records.append(record)
+                        continue
+
+                print(f"Failed to refresh EHRAID {ehraid}:", errors_by_ehraid[ehraid])
+                if errors is not None:
+                    errors.append({'ehraid': ehraid, 'error': errors_by_ehraid[ehraid]})
+                if ehraid in saved:
+                    records.append(saved[ehraid][2])
+
+            # only the new and changed firms are translated. The ones that could not be (or not in 'translate' mode) are saved
+            # with a fingerprint that marks them, so that the next run translates them again
+            originals = [(record.get('status'), record.get('purpose')) for record in new_records]
+            _translate_records(new_records, ['status', 'purpose'])
+            changed = [(ehraid, fingerprint if _refresh_translated(*texts) else fingerprint + _UNTRANSLATED, snapshot, record)
+                       for (ehraid, fingerprint, snapshot, record), texts in zip(changed, originals)]
+            state.save(checked, changed, changes)
+            if changelog is not None and changes:
+                for change in changes:
+                    changelog.write(json.dumps(change) + '\n')
+                changelog.flush()
+            all_changes.extend(changes)
+            n_changed += len(changed)
+    finally:
+        if changelog is not None:
+            changelog.close()
+
+    print(f"{len(ehraids)} firms refreshed: {n_changed} derived again (new, changed or not translated yet), {len(all_changes)} changes found")
+    return records, all_changes
+
+
+## FUNCTION 8
+
+def _groups_core(ehraids, direction, max_hops, max_nodes, errors, df, arrow):
+    # get_acquisition_groups, as a core generator (see ## CORE)
+
+    if direction not in ('down', 'up', 'both'):
+        raise ValueError("direction must be 'down', 'up' or 'both'")
+
+    roots = list(dict.fromkeys(int(ehraid.get('ehraid') if isinstance(ehraid, dict) else ehraid) for ehraid in ehraids))
+
+    firms = {}      # ehraid -> record, in the order the firms are found
+    edges = {}      # (acquirer, acquired) -> None, takeovers in the order they are found
+    failed = []
+
+    # all the roots are the first level of one breadth first search: a firm reached from several roots is fetched only once
+    results, errors_by_ehraid = yield ('firms', roots)
+    failed.extend({'ehraid': e, 'error': errors_by_ehraid[e]} for e in roots if e in errors_by_ehraid)
+    frontier = [(results[e], e) for e in roots if e in results]
+    for data, root in frontier:
+        firms[root] = dict(_acquisition_record(data, 0), root=root)
+    visited = set(roots)
+    level = 0
+
+    while frontier and (max_hops is None or level < max_hops):
+
+        # neighbours of the firms of this level: the firms they have taken over and/or the firms that took them over
+        new_ehraids = []
+        found_by = {}
+        for data, root in frontier:
+            ehraid = int(data.get('ehraid'))
+            takeovers = []
+            if direction in ('down', 'both'):
+                takeovers += [(ehraid, int(element['ehraid'])) for element in data.get('hasTakenOver') or []]
+            if direction in ('up', 'both'):
+                takeovers += [(int(element['ehraid']), ehraid) for element in data.get('wasTakenOverBy') or []]
+            for acquirer, acquired in takeovers:
+                other = acquired if acquirer == ehraid else acquirer
+                if other not in visited:
+                    if max_nodes is not None and len(visited) >= max_nodes:
+                        continue
+                    visited.add(other)
+                    new_ehraids.append(other)
+                    found_by[other] = root
+                edges[(acquirer, acquired)] = None
+
+        # fetch all the new firms of the next level
+        results, errors_by_ehraid = yield ('firms', new_ehraids)
+        failed.extend({'ehraid': e, 'error': errors_by_ehraid[e]} for e in new_ehraids if e in errors_by_ehraid)
+
+        level += 1
+        frontier = [(results[e], found_by[e]) for e in new_ehraids if e in results]
+        for data, root in frontier:
+            firms[int(data.get('ehraid'))] = dict(_acquisition_record(data, level), root=root)
+
+    # firms that could not be fetched are left out, together with their takeovers
+    if failed:
+        print(f"Failed to fetch details for {len(failed)} companies:", [f['ehraid'] for f in failed])
+        if errors is not None:
+            errors.extend(failed)
+    edges = [(acquirer, acquired) for acquirer, acquired in edges if acquirer in firms and acquired in firms]
+
+    # groups: connected components of the takeovers (union-find), numbered from 1 in the order their firms were found
+    component = {ehraid: ehraid for ehraid in firms}
+
+    def find(ehraid):
+        while component[ehraid] != ehraid:
+            component[ehraid] = component[component[ehraid]]
+            ehraid = component[ehraid]
+        return ehraid
+
+    for acquirer, acquired in edges:
+        component[find(acquirer)] = find(acquired)
+    group_ids = {}
+    for ehraid, firm in firms.items():
+        firm['group'] = group_ids.setdefault(find(ehraid), len(group_ids) + 1)
+
+    # ultimate parent: going up through the acquirers (the smallest ehraid when there are several) until a firm that nobody took over.
+    # In a cycle of takeovers, the smallest ehraid of the cycle is the ultimate parent
+    acquirers_of = {}
+    for acquirer, acquired in edges:
+        if acquirer != acquired:
+            acquirers_of.setdefault(acquired, []).append(acquirer)
+    ultimate = {}
+    for ehraid in firms:
+        path = []
+        on_path = set()
+        node = ehraid
+        while node not in ultimate and node not in on_path:
+            path.append(node)
+            on_path.add(node)
+            if node not in acquirers_of:
+                ultimate[node] = node
+                break
+            node = min(acquirers_of[node])
+        top = ultimate[node] if node in ultimate else min(path[path.index(node):])
+        for node in path:
+            ultimate[node] = top
+    for ehraid, firm in firms.items():
+        firm['ultimate_parent'] = ultimate[ehraid]
+
+    firms = list(firms.values())
+    edges = [{'acquirer': acquirer, 'acquired': acquired, 'group': group_ids[find(acquirer)]} for acquirer, acquired in edges]
 
-        #add label of the x axis
-        plt.xlabel('Number of Hops')
+    # translate the information in 'status' to english
+    yield ('translate', firms, ['status'])
 
-        #the x axis should have only integer values
-        plt.xticks(range(df['hops'].max()+1))
+    if df == True:
+        firms = _to_frame(firms, arrow=arrow)
+        edges = _to_frame(edges, columns=['acquirer', 'acquired', 'group'], arrow=arrow)
 
-        #add title
-        plt.title('Acquisitions')
+    return firms, edges
 
-        #hide the y axis ticks
-        plt.yticks([])
 
-        #hide the borders
-        plt.box(False)
+def get_acquisition_groups(ehraids, direction='both', max_hops=None, max_nodes=None, max_workers=1, errors=None, df=False, arrow=False):
 
-        #show the plot
-        plt.show()
-    else:
-        return "Please provide a list of dictionaries with information about firms and their acquisitions as input. You can get this data by running the function acquisitions_data in this same package. Use the default option df=False"
-    
-## FUNCTION 4
-#This function checks a specific company (identified by its EHRAID) acquirers.
-def check_acquirers(ehraid, df=True):
-    
     '''
-    
-    This function takes in the EHRAID of a company and returns a list of dictionaries with information about the companies that took over the given company.
+
+    Takes in a list of ehraids and maps the groups of firms they belong to: from all of them at once, it explores the firms they have
+    taken over (hasTakenOver) and the firms that took them over (wasTakenOverBy), then the takeovers of those firms, and so on.
+    The roots share one breadth first search, so a subsidiary shared by several groups is fetched only once.
+
+    Returns one merged graph: every firm found, with the group (connected set of takeovers) it belongs to and its ultimate parent,
+    and the list of takeovers between them.
 
     Parameters:
-    ehraid (str): EHRAID of the company to check the acquirers for.
-    df (bool): True by default. If True, returns the data as a pandas DataFrame. If False, returns the data as a list of dictionaries.
+    ehraids (list): ehraids of the firms to start from
+    direction (str): 'both' (default) explores takeovers in both directions, 'down' only the firms taken over, 'up' only the acquirers
+    max_hops (int): None by default. If given, firms further than max_hops hops from all the roots are not explored
+    max_nodes (int): None by default. If given, at most max_nodes firms are fetched
+    max_workers (int): 1 by default. Maximum number of firms of the same level fetched at the same time
+    errors (list): None by default. If a list is given, every firm that could not be fetched is appended to it as a dictionary {'ehraid': ..., 'error': ...}
+    df (bool): if True, returns the firms and the takeovers as pandas DataFrames
+    arrow (bool): False by default. If True (and df=True), the columns of the DataFrames are backed by pyarrow arrays. Needs pyarrow.
 
     Returns:
-    if df=True (default):
-    acquirers (dataframe): a dataframe with information about the companies that took over the given company. If df=False, returns a list of dictionaries.
+    firms (list): a list of dictionaries, one per firm, with the same fields as get_acquisitions_data and:
+                  hops (distance from the closest root), root (ehraid of the root it was found from), group (id of its group, from 1)
+                  and ultimate_parent (ehraid of the top acquirer above it, among the firms found; the firm itself if nobody took it over)
+    edges (list): a list of dictionaries {'acquirer', 'acquired', 'group'}, one per takeover between the firms found
 
-    if df=False:
-    acquirers (list): a list of dictionaries with information about the companies that took over the given company.
+    Example: firms, edges = get_acquisition_groups(['415520', '1215435'], max_workers=8)
 
     '''
 
-    if type(ehraid) != str:
-        return "Please provide a string of the EHRAID of the company as input. Example: '110662'"
+    with _metrics.span('get_acquisition_groups'):
+        return _run(_groups_core(ehraids, direction, max_hops, max_nodes, errors, df, arrow), max_workers)
 
-    company_url = f'https://www.zefix.ch/ZefixREST/api/v1/firm/{ehraid}'
-    r = requests.get(company_url)
-    data = r.json()
 
-    if r.status_code != 200:
-        print(f"Failed to fetch details for EHRAID {ehraid}:", r.text)
-        return None
-    
-    was_taken_over_by = data.get('wasTakenOverBy', [])
-    if not was_taken_over_by:
-        print(f"No acquisition records found for EHRAID {ehraid}.")
-        return None
-    
-    # get the legal form names from the API
-    legal_form_url = "https://www.zefix.ch/ZefixREST/api/v1/legalForm"
-    legal_forms_response = requests.get(legal_form_url)
-    legal_forms = legal_forms_response.json()
+async def aget_acquisition_groups(ehraids, direction='both', max_hops=None, max_nodes=None, max_workers=8, errors=None, df=False, arrow=False):
 
-    if legal_forms_response.status_code != 200:
-        print("Failed to fetch details for legal forms. The legal form will be provided as a numeric id. Read the zefix documentation for further details on what that id means.")
-    
-    
-    # search the details for the acquirer company and save them
-    acquirers = []
-    for acquirer in was_taken_over_by:
-        acquirer_details = requests.get(f'https://www.zefix.ch/ZefixREST/api/v1/firm/{acquirer["ehraid"]}')
-        acquirer_data = acquirer_details.json()
-        
-        if acquirer_details.status_code != 200:
-            print(f"Failed to fetch details for acquirer EHRAID {acquirer['ehraid']}:", acquirer_details.text)
-            continue
+    '''
 
-        # Here we specify the information we are looking for
+    Async version of get_acquisition_groups: same parameters and same results, without blocking the event loop.
+    Up to max_workers firms (8 by default) are fetched at the same time. Needs aiohttp.
 
-        # create a dictionary with legal form id as key
-        legal_forms_dictionary = {item['id']: item for item in legal_forms}
+    Example: firms, edges = await aget_acquisition_groups(['415520', '1215435'])
 
-        # get the English name of a legal form associated with the given ID provided by the API
-        firm_legal_form_name = legal_forms_dictionary[data['legalFormId']]['name']['en']
+    '''
 
-        record = {
-            'name': acquirer_data['name'],
-            'ehraid': acquirer_data['ehraid'],
-            'legalSeat': acquirer_data.get('legalSeat'),
-            "legalFormId": acquirer_data.get("legalFormId") if legal_forms_response.status_code != 200 else firm_legal_form_name ,
-            'status': acquirer_data.get('status'),
-            "cantonalExcerptWeb": acquirer_data.get("cantonalExcerptWeb"),
-            'deleteDate': acquirer_data.get('deleteDate'),
-            'purpose':acquirer_data.get('purpose'),
-            'capitalNominal':acquirer_data.get('capitalNominal'),
-            }
-        
-        #translate the information in 'purpuse' to english
-        if record["purpose"]: 
-            translator = Translator()
-            purpose_english = translator.translate(record['purpose'], dest='en')
-            record['purpose'] = purpose_english.text
-
-        #translate the information in 'status' to english
-        if record["status"]:    
-            if record['status'].upper() == 'EXISTIEREND':
-                record['status'] = 'Active'
-            elif record['status'].upper() == 'GELOESCHT':
-                record['status'] = 'Deleted'
-            elif record['status'].upper() == 'IN_AUFLOESUNG':
-                record['status'] = 'In Liquidation'
-            else:
-                translator = Translator()
-                status_english = translator.translate(record['status'], dest='en')
-                record['status'] = status_english.text
+    with _metrics.span('aget_acquisition_groups'):
+        return await _arun(_groups_core(ehraids, direction, max_hops, max_nodes, errors, df, arrow), max_workers)
 
-        acquirers.append(record)
-         
-    if df==True:
-        acquirers = pd.DataFrame(acquirers)
 
-    return acquirers
+def main(argv=None):
+
+    '''
+
+    Command line interface. Example:
+
+    python zefix_tools.py enrich ehraids.csv enriched/ --column ehraid --workers 8 --chunk-size 1000 --rate-limit 10
+    python zefix_tools.py refresh portfolio.csv --state zefix_refresh.sqlite --changelog changes.jsonl --output portfolio.jsonl
+
+    '''
+
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='zefix_tools', description='Tools for the Zefix API')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enrich = commands.add_parser('enrich', help='enrich a file of ehraids (CSV, Parquet or JSON Lines) and save the results in chunks')
+    enrich.add_argument('input_path', help='file with the ehraids (.csv, .parquet, .jsonl or .jsonl.gz)')
+    enrich.add_argument('output_dir', help='directory where the part files are saved; rerun with the same directory to resume')
+    enrich.add_argument('--column', default='ehraid', help='name of the column with the ehraids (default: ehraid)')
+    enrich.add_argument('--workers', type=int, default=8, help='firms fetched at the same time (default: 8), in each process')
+    enrich.add_argument('--processes', type=int, default=None, help='worker processes sharing the work, to use several CPU cores (default: 1)')
+    enrich.add_argument('--chunk-size', type=int, default=1000, help='firms saved in each part file (default: 1000)')
+    enrich.add_argument('--format', default='csv', choices=['csv', 'parquet'], help='format of the part files (default: csv, parquet needs pyarrow)')
+    enrich.add_argument('--rate-limit', type=float, default=10, help='maximum requests per second (default: 10)')
+    enrich.add_argument('--cache', default=None, help='path of a ZefixCache file to reuse responses between runs')
+
+    refresh = commands.add_parser('refresh', help='refresh a portfolio of ehraids, deriving again only the firms that changed, and list the changes')
+    refresh.add_argument('input_path', help='file with the ehraids (.csv, .parquet, .jsonl or .jsonl.gz)')
+    refresh.add_argument('--column', default='ehraid', help='name of the column with the ehraids (default: ehraid)')
+    refresh.add_argument('--state', default='zefix_refresh.sqlite', help='state file kept between runs (default: zefix_refresh.sqlite)')
+    refresh.add_argument('--changelog', default=None, help='JSON Lines file where the changes found are added')
+    refresh.add_argument('--output', default=None, help='JSON Lines file where all the enriched records are saved (overwritten)')
+    refresh.add_argument('--workers', type=int, default=8, help='firms fetched at the same time (default: 8)')
+    refresh.add_argument('--chunk-size', type=int, default=1000, help='firms fetched and saved together (default: 1000)')
+    refresh.add_argument('--rate-limit', type=float, default=10, help='maximum requests per second (default: 10)')
+    refresh.add_argument('--cache', default=None, help='path of a ZefixCache file to reuse responses between runs')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'enrich':
+        configure_client(rate_limit=args.rate_limit, pool_size=max(args.workers, 10), cache=args.cache)
+        errors = []
+        enrich_file(args.input_path, args.output_dir, column=args.column, max_workers=args.workers,
+                    chunk_size=args.chunk_size, file_format=args.format, errors=errors, processes=args.processes)
+        if errors:
+            print(f"{len(errors)} firms could not be fetched, run the same command again to retry them")
+            return 1
+
+    if args.command == 'refresh':
+        configure_client(rate_limit=args.rate_limit, pool_size=max(args.workers, 10), cache=args.cache)
+        errors = []
+        records, changes = refresh_companies(read_ehraids(args.input_path, args.column), state=args.state, max_workers=args.workers,
+                                             chunk_size=args.chunk_size, changelog_path=args.changelog, errors=errors)
+        if args.output is not None:
+            write_jsonl(records, args.output, append=False)
+        if errors:
+            print(f"{len(errors)} firms could not be fetched, they kept their last saved record")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())